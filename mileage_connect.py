@@ -4,16 +4,27 @@
 Mileage Connect Tool
 --------------------
 
-Read a list of mileage values from a text file and draw a polyline from each
-corresponding mileage position on the railway to a fixed coordinate.
+Read a list of mileage values from a text file and draw a line from each
+corresponding mileage position on the railway to a fixed coordinate, or, in
+multi-target mode, to the nearest of many candidate targets read from a table
+or from a DXF layer of points / block references.
 
 依赖: ezdxf >= 0.18
 """
 
+import argparse
 import re
+import numpy as np
 from pathlib import Path
 import ezdxf
-from ezdxf.math import Vec2
+from rail_alignment import Alignment, MileageIndex
+from rail_index import KDTree
+from rail_loader import load_polylines, group_polylines, load_points
+from rail_cache import file_digest, cached_rails, prepare_rails
+import rail_profile
+from rail_splice import save_additions
+from rail_binary import sidecar
+from rail_table import read_table
 
 # -------- 配置区 -----------------------------------------------------------
 
@@ -36,72 +47,35 @@ MILEAGE_FILE = r'mileage_list.txt'
 # 固定目标坐标 (X, Y, Z)
 TARGET_POINT = (553263.2769, 3430423.5097, 0.0)
 
+# 多目标模式: 给出目标点表格 (.csv / .xlsx 等, 含 X、Y[、Z] 列, 缺少列名时取前几列) 或 DXF 中的目标点图层
+# (POINT / 图块 INSERT) 时, 每个里程位置连接到最近的目标点 (k-d 树批量查找), 不再使用 TARGET_POINT
+TARGET_FILE = None
+TARGET_LAYER = None
+
+# 多目标模式下的最大连接距离 (米), 最近目标点更远的里程跳过; None 为不限
+MAX_TARGET_DIST = None
+
 # 输出连接线所在图层名称
 CONNECT_LAYER = '连接线'
 
-# 加密阈值 (若相邻点距离大于此值则插入中间点)
-MAX_SEG_LEN = 5.0
+# 加密阈值: None 为按直线/圆弧图元精确定位; 给数值 (米) 时沿图元插入中间点, 按弦近似
+MAX_SEG_LEN = None
 
 # 几何容差
 TOLERANCE = 1e-6
 
-# ---------------------------------------------------------------------------
+# 是否使用铁路折线的磁盘缓存 (见 rail_cache.py)
+USE_CACHE = True
 
+# 输出方式 (见 rail_splice.py): 'splice' 在原文件副本末尾追加连接线; 'overlay' 只写连接线的小 DXF;
+# 'full' 载入整张图后重新保存
+SAVE_MODE = 'splice'
 
-def poly2d(entity):
-    """Project a LWPOLYLINE/POLYLINE entity to a list of Vec2."""
-    if entity.dxftype() not in ('LWPOLYLINE', 'POLYLINE'):
-        raise TypeError(f'Unsupported entity type: {entity.dxftype()}')
-    return [Vec2(pt[:2]) for pt in entity.get_points()]
-
-
-def densify(points, max_len=MAX_SEG_LEN):
-    """Insert intermediate points so that no segment is longer than max_len."""
-    dense = []
-    for i in range(len(points) - 1):
-        a, b = points[i], points[i + 1]
-        dense.append(a)
-        dist = a.distance(b)
-        if dist > max_len:
-            steps = int(dist // max_len)
-            for k in range(1, steps + 1):
-                t = k / (steps + 1)
-                dense.append(a + (b - a) * t)
-    dense.append(points[-1])
-    return dense
-
-
-def calc_cum_len(vecs):
-    cum = [0.0]
-    for i in range(len(vecs) - 1):
-        cum.append(cum[-1] + vecs[i].distance(vecs[i + 1]))
-    return cum
-
-
-def get_point_and_tangent(vecs, cum, target_len):
-    if target_len <= 0:
-        pt = vecs[0]
-        t = vecs[1] - vecs[0] if len(vecs) >= 2 else Vec2(1, 0)
-        return pt, t.normalize() if t.magnitude > TOLERANCE else Vec2(1, 0)
-    if target_len >= cum[-1]:
-        pt = vecs[-1]
-        t = vecs[-1] - vecs[-2] if len(vecs) >= 2 else Vec2(1, 0)
-        return pt, t.normalize() if t.magnitude > TOLERANCE else Vec2(1, 0)
-
-    for i in range(len(cum) - 1):
-        if cum[i] <= target_len <= cum[i + 1]:
-            a, b = vecs[i], vecs[i + 1]
-            seg_len = cum[i + 1] - cum[i]
-            if seg_len < TOLERANCE:
-                pt = a
-                t = b - a
-            else:
-                ratio = (target_len - cum[i]) / seg_len
-                pt = a + (b - a) * ratio
-                t = b - a
-            t_rail = t.normalize() if t.magnitude > TOLERANCE else Vec2(1, 0)
-            return pt, t_rail
-    return vecs[-1], Vec2(1, 0)
+# 二进制 DXF: True 时以底图的二进制副本 (按内容哈希缓存, 见 rail_binary.py) 为读取和拼接的源, 输出二进制 DXF;
+# 输入本身是二进制 DXF (如 BINARY_DXF 方式下 rail_power_draw.py 的输出) 时无需副本
+BINARY_DXF = False
+
+# ---------------------------------------------------------------------------
 
 
 def read_mileages(file_path: Path):
@@ -118,7 +92,138 @@ def read_mileages(file_path: Path):
     return mileages
 
 
-def main():
+def read_targets(file_path: Path):
+    """Read candidate targets from a table; returns a (T, 3) array (Z defaults to 0)."""
+    header, rows = read_table(file_path)
+    names = [str(h).strip().upper() for h in header]
+    if 'X' in names and 'Y' in names:
+        cx, cy, cz = names.index('X'), names.index('Y'), names.index('Z') if 'Z' in names else None
+    else:
+        cx, cy, cz = 0, 1, 2
+    targets = []
+    for row in rows:
+        try:
+            x, y = float(row[cx]), float(row[cy])
+        except (IndexError, TypeError, ValueError):
+            print(f'Skip invalid target row: {row}')
+            continue
+        z = row[cz] if cz is not None and cz < len(row) else None
+        targets.append((x, y, float(z) if isinstance(z, (int, float)) else 0.0))
+    return np.array(targets, dtype=float).reshape(-1, 3)
+
+
+def load_targets(dxf_path, target_file=None, target_layer=None):
+    """Candidate targets from target_file, else from the points on target_layer; None if neither is set."""
+    if target_file:
+        with rail_profile.stage('read_targets'):
+            return read_targets(Path(target_file))
+    if target_layer:
+        with rail_profile.stage('read_targets'):
+            return load_points(dxf_path, lambda name: name == target_layer).get(
+                target_layer, np.empty((0, 3)))
+    return None
+
+
+@rail_profile.timed('connect')
+def connect(dxf_path, mileages, rail_layers=None, target=None, out_path=None, binary=None,
+            targets=None, max_dist=None):
+    """
+    Draw a connector from each mileage position to target (default TARGET_POINT)
+    and save as out_path (default <name>_connected.dxf, or <name>_connectors_overlay.dxf
+    in overlay mode). Connectors are LINE entities. With binary (default BINARY_DXF)
+    the drawing is read through its binary sidecar and written as binary DXF.
+    targets, a (T, 2|3) array, switches to multi-target mode: every position is
+    connected to its nearest target, and positions farther than max_dist
+    (default MAX_TARGET_DIST) from every target are skipped.
+    Returns the number of connectors drawn.
+    """
+    rail_layers = RAIL_LAYERS if rail_layers is None else rail_layers
+    target3d = TARGET_POINT if target is None else tuple(target)
+    binary = BINARY_DXF if binary is None else binary
+
+    with rail_profile.stage('cache_lookup'):
+        digest = file_digest(dxf_path) if USE_CACHE else None
+        rails = cached_rails(digest, rail_layers, MAX_SEG_LEN)
+    source = sidecar(dxf_path, digest) if binary else dxf_path
+
+    # 只有整图保存时才载入整张图
+    doc = None
+    if SAVE_MODE == 'full':
+        with rail_profile.stage('read_dxf'):
+            doc = ezdxf.readfile(source)
+    missing = [layer_name for layer_name in rail_layers if layer_name not in rails]
+    layer_polys = {}
+    if missing and doc is not None:
+        layer_polys = group_polylines(doc.modelspace(), lambda name: name in missing)
+    elif missing:
+        with rail_profile.stage('read_dxf'):
+            _, layer_polys = load_polylines(source, lambda name: name in missing)
+    rails.update(prepare_rails(layer_polys, missing, rail_layers, MAX_SEG_LEN, digest))
+
+    # 各图层拼接好的分段按图层顺序排成一列, 里程落在其范围内的第一个分段即所属分段
+    sections = []
+    for layer_name, offset in rail_layers.items():
+        if not rails[layer_name]:
+            print(f"Warning: 图层 {layer_name} 未找到折线, 已跳过")
+            continue
+        sections.extend(Alignment(pts, bulge, offset, cum) for _, pts, cum, bulge in rails[layer_name])
+    index = MileageIndex([s.start_mileage for s in sections], [s.end_mileage for s in sections], TOLERANCE)
+    values = np.array(mileages, dtype=float)
+    section_of = index.lookup(values)
+    for idx in np.flatnonzero(section_of < 0):
+        print(f"[警告] 里程 {mileages[idx]} 米不在任何铁路图层范围内, 已跳过")
+
+    # 每个分段批量定位一次, 再按输入顺序绘制
+    found = {}
+    placed = np.flatnonzero(section_of >= 0)
+    order = placed[np.argsort(section_of[placed], kind='stable')]
+    groups = np.split(order, np.flatnonzero(np.diff(section_of[order])) + 1) if len(order) else []
+    for idxs in groups:
+        with rail_profile.stage('locate'):
+            pts, _ = sections[section_of[idxs[0]]].locate(values[idxs])
+        found.update(zip(idxs.tolist(), pts))
+
+    # 多目标模式: 全部位置一次性在目标点的 k-d 树中查找最近者
+    rows = sorted(found)
+    if targets is None:
+        ends = [target3d] * len(rows)
+    else:
+        targets = (np.asarray(targets, dtype=float).reshape(len(targets), -1) if len(targets)
+                   else np.empty((0, 3)))
+        if not len(targets):
+            print("[警告] 没有任何目标点, 未绘制连接线")
+        if targets.shape[1] < 3:
+            targets = np.column_stack([targets[:, :2], np.zeros(len(targets))])
+        max_dist = MAX_TARGET_DIST if max_dist is None else max_dist
+        with rail_profile.stage('assign_targets'):
+            nearest, _ = KDTree(targets).nearest(np.array([found[i] for i in rows]).reshape(-1, 2), max_dist)
+        far = int((nearest < 0).sum())
+        if far and len(targets):
+            print(f"[警告] {far} 个里程位置在 {max_dist} 米内没有目标点, 已跳过")
+        rows = [i for i, k in zip(rows, nearest.tolist()) if k >= 0]
+        ends = [tuple(p) for p in targets[nearest[nearest >= 0]].tolist()]
+        rail_profile.count('targets', len(targets))
+        rail_profile.count('mileages_too_far', far)
+
+    def emit(msp):
+        with rail_profile.stage('emit'):
+            for idx, end in zip(rows, ends):
+                pt = found[idx]
+                msp.add_line((pt[0], pt[1], 0.0), end,
+                             dxfattribs={'layer': CONNECT_LAYER, 'color': 3})
+    rail_profile.count('mileages_placed', len(rows))
+    rail_profile.count('mileages_skipped', len(mileages) - len(rows))
+
+    dxf_path = Path(dxf_path)
+    suffix = '_connectors_overlay.dxf' if SAVE_MODE == 'overlay' else '_connected.dxf'
+    out_path = Path(out_path) if out_path else dxf_path.with_name(dxf_path.stem + suffix)
+    with rail_profile.stage('save_dxf'):
+        save_additions(source, out_path, {CONNECT_LAYER: 3}, emit, SAVE_MODE, doc, binary)
+    print(f"[OK] 输出文件 → {out_path.name}")
+    return len(rows)
+
+
+def main(binary=None, target_file=None, target_layer=None, max_dist=None):
     dxf_path = Path(DXF_FILE)
     if not dxf_path.exists():
         print(f'DXF 文件未找到: {dxf_path}')
@@ -129,47 +234,26 @@ def main():
         print(f'里程文件未找到: {txt_path}')
         return
 
-    doc = ezdxf.readfile(dxf_path)
-    msp = doc.modelspace()
-
-    if CONNECT_LAYER not in {layer.dxf.name for layer in doc.layers}:
-        doc.layers.new(name=CONNECT_LAYER, dxfattribs={'color': 3})
-
-    rail_data = {}
-    for layer_name, offset in RAIL_LAYERS.items():
-        ents = list(msp.query(f'LWPOLYLINE[layer=="{layer_name}"]')) + \
-               list(msp.query(f'POLYLINE[layer=="{layer_name}"]'))
-        if not ents:
-            print(f"Warning: 图层 {layer_name} 未找到折线, 已跳过")
-            continue
-        rail_ent = ents[0]
-        pts2d = poly2d(rail_ent)
-        dense_pts = densify(pts2d)
-        cum_len = calc_cum_len(dense_pts)
-        rail_data[layer_name] = (dense_pts, cum_len, offset)
-
-    mileages = read_mileages(txt_path)
-    target3d = TARGET_POINT
-
-    for M in mileages:
-        placed = False
-        for layer_name, (dense_pts, cum_len, offset) in rail_data.items():
-            total_len = cum_len[-1]
-            local_len = M - offset
-            if local_len < -TOLERANCE or local_len > total_len + TOLERANCE:
-                continue
-            pt, _ = get_point_and_tangent(dense_pts, cum_len, local_len)
-            msp.add_polyline3d([(pt.x, pt.y, 0.0), target3d],
-                               dxfattribs={'layer': CONNECT_LAYER, 'color': 3})
-            placed = True
-            break
-        if not placed:
-            print(f"[警告] 里程 {M} 米不在任何铁路图层范围内, 已跳过")
-
-    out_path = dxf_path.with_name(dxf_path.stem + '_connected.dxf')
-    doc.saveas(out_path)
-    print(f"[OK] 输出文件 → {out_path.name}")
+    with rail_profile.stage('read_mileages'):
+        mileages = read_mileages(txt_path)
+    target_file = target_file or TARGET_FILE
+    if target_file and not Path(target_file).exists():
+        print(f'目标点文件未找到: {target_file}')
+        return
+    targets = load_targets(dxf_path, target_file, target_layer or TARGET_LAYER)
+    connect(dxf_path, mileages, binary=binary, targets=targets, max_dist=max_dist)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='从铁路里程位置向固定坐标绘制连接线')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help='记录各阶段耗时、峰值内存和计数，写入 JSON（缺省 <DXF>.profile.json）')
+    parser.add_argument('--binary', action='store_true', default=BINARY_DXF,
+                        help='经底图的二进制副本读取，输出二进制 DXF')
+    parser.add_argument('--targets', metavar='FILE', help='目标点表格（X、Y[、Z] 列），连接到最近的目标点')
+    parser.add_argument('--target-layer', metavar='LAYER', help='以 DXF 中该图层的点 / 图块为目标点')
+    parser.add_argument('--max-dist', type=float, help='多目标模式下的最大连接距离（米）')
+    args = parser.parse_args()
+    report = None if args.profile is None else args.profile or Path(DXF_FILE).with_suffix('.profile.json')
+    with rail_profile.session(report):
+        main(args.binary, args.targets, args.target_layer, args.max_dist)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_alignment.py — 铁路中心线对象：里程 ↔ 坐标的正反算
+# 1) Alignment 保存一条中心线的顶点、凸度、累积长度和里程偏置，建立一次后反复查询
+# 2) 正算 locate(里程)：二分查找所在线段，取点和切线
+# 3) 反算 project(XY)：在线段网格索引（rail_index.SegmentGrid）中由近及远扩大搜索范围，
+#    只对附近线段求精确距离，每个查询点的开销与中心线总长无关；
+#    远离中心线的点在搜索框的网格数超过线段数时改为逐段扫描，开销不超过 O(线段数)
+# 4) 结果与 rail_geom.project_points 的逐段扫描一致（距离相同时取序号最小的线段）
+# 5) stitch_polylines：同一图层的多条折线按首尾端点拼接为有序分段
+# 6) MileageIndex：里程 → 分段的查找表，二分查找，分段再多也是对数时间
+
+import numpy as np
+
+from rail_geom import (TOLERANCE, CHUNK_SIZE, as_points, calc_cum_len, segments, segment_bounds,
+                       segment_lengths, segment_distance, segment_points_tangents,
+                       points_and_tangents)
+from rail_index import SegmentGrid
+
+STITCH_TOL = 1e-3            # 折线端点相距不超过此值（米）视为相接
+
+
+class Alignment:
+    """
+    一条铁路中心线。points 为 (N, 2) 顶点，bulge 为各线段凸度（None 为全部直线），
+    offset 为图层里程偏置；cum 为已算好的累积长度（如来自 rail_cache，拼接分段的 cum
+    从前面分段的总长起算），缺省时从 0 重新计算。里程 = offset + 累积长度。
+    线段索引在第一次反算时才建立，只做正算时没有额外开销。
+    """
+
+    def __init__(self, points, bulge=None, offset=0.0, cum=None, cell=None):
+        self.points = as_points(points)
+        n_seg = max(len(self.points) - 1, 0)
+        self.bulge = np.zeros(n_seg) if bulge is None else np.asarray(bulge, dtype=np.float64)[:n_seg]
+        self.offset = float(offset)
+        self.cum = calc_cum_len(self.points, self.bulge) if cum is None else np.asarray(cum, dtype=np.float64)
+        self.starts, self.dirs = segments(self.points)
+        self.seg_len = segment_lengths(self.dirs, self.bulge)
+        self.cell = cell
+        self.grid = None
+
+    def _build_index(self):
+        # 只索引非退化线段，与 project_points 的取舍相同
+        self.index = np.flatnonzero(np.einsum('ij,ij->i', self.dirs, self.dirs) >= TOLERANCE ** 2)
+        lo, hi = segment_bounds(self.starts[self.index], self.dirs[self.index], self.bulge[self.index])
+        self.grid = SegmentGrid(lo, hi, self.cell)
+        self.lo = lo.min(axis=0) if len(lo) else np.zeros(2)
+        self.hi = hi.max(axis=0) if len(hi) else np.zeros(2)
+
+    @property
+    def length(self):
+        return float(self.cum[-1] - self.cum[0]) if len(self.cum) else 0.0
+
+    @property
+    def start_mileage(self):
+        return self.offset + (float(self.cum[0]) if len(self.cum) else 0.0)
+
+    @property
+    def end_mileage(self):
+        return self.start_mileage + self.length
+
+    def contains(self, mileage, tol=TOLERANCE):
+        """里程是否落在本中心线范围内（放宽 tol）。"""
+        m = np.asarray(mileage, dtype=np.float64)
+        return (m >= self.start_mileage - tol) & (m <= self.end_mileage + tol)
+
+    def locate(self, mileage):
+        """正算：一批里程 → (点, 切线单位向量)，均为 (K, 2)。"""
+        local = np.atleast_1d(np.asarray(mileage, dtype=np.float64)) - self.offset
+        return points_and_tangents(self.points, self.cum, local, self.bulge)
+
+    def nearest(self, xy):
+        """
+        一批点到中心线的最近线段，返回 (seg, t, dist)：线段序号、最近点的长度比例、距离。
+        中心线没有有效线段时 seg 为 -1、dist 为 inf。
+        """
+        if self.grid is None:
+            self._build_index()
+        q = as_points(xy)
+        n = len(q)
+        seg = np.full(n, -1, dtype=np.int64)
+        t = np.zeros(n)
+        dist = np.full(n, np.inf)
+        if not len(self.index) or not n:
+            return seg, t, dist
+
+        # 距离不超过 r 的线段，其包围盒必与 ±r 的查询框重叠；
+        # 找到的最近距离 ≤ r 或查询框已盖住整条中心线时结果即为精确解，否则 r 加倍重查。
+        # 查询框的网格数随 (r / cell)² 增长，超过线段数后网格不再省事，剩下的点改为逐段扫描
+        reach = np.maximum(np.abs(q - self.lo), np.abs(q - self.hi)).max(axis=1)
+        todo = np.arange(n)
+        r = self.grid.cell
+        n_seg = len(self.index)
+        while len(todo):
+            cells = (2.0 * r / self.grid.cell + 2.0) ** 2
+            if cells > n_seg:
+                self._scan(q, todo, seg, t, dist)
+                break
+            step = max(1, int(CHUNK_SIZE // cells))   # 每批展开的网格数不超过 CHUNK_SIZE
+            for s in range(0, len(todo), step):
+                rows = todo[s:s + step]
+                p = q[rows]
+                qi, si = self.grid.query(p - r, p + r)
+                if len(qi):
+                    k = self.index[si]
+                    d, tt = segment_distance(p[qi], self.starts[k], self.dirs[k], self.bulge[k])
+                    order = np.lexsort((k, d, qi))   # 每个查询点取距离最小、同距离时序号最小的线段
+                    first = order[np.r_[True, qi[order][1:] != qi[order][:-1]]]
+                    hit = rows[qi[first]]
+                    seg[hit], t[hit], dist[hit] = k[first], tt[first], d[first]
+            todo = todo[(dist[todo] > r) & (reach[todo] > r)]
+            r *= 2.0
+        return seg, t, dist
+
+    def _scan(self, q, rows, seg, t, dist):
+        """rows 中的点逐段扫描全部有效线段，结果写入 seg, t, dist（同距离时取序号最小的线段）。"""
+        k = self.index
+        step = max(1, CHUNK_SIZE // len(k))
+        for s in range(0, len(rows), step):
+            part = rows[s:s + step]
+            p = np.repeat(q[part], len(k), axis=0)
+            kk = np.tile(k, len(part))
+            d, tt = segment_distance(p, self.starts[kk], self.dirs[kk], self.bulge[kk])
+            d, tt = d.reshape(len(part), -1), tt.reshape(len(part), -1)
+            best = d.argmin(axis=1)                  # argmin 取第一个最小值，即序号最小的线段
+            pick = np.arange(len(part))
+            seg[part], t[part], dist[part] = k[best], tt[pick, best], d[pick, best]
+
+    def project(self, xy):
+        """
+        反算：一批点 → (里程, 横向偏距, 切线单位向量)。
+        偏距沿前进方向左正右负；找不到线段时里程和偏距为 NaN。
+        """
+        q = as_points(xy)
+        seg, t, dist = self.nearest(q)
+        ok = seg >= 0
+        mileage = np.full(len(q), np.nan)
+        lateral = np.full(len(q), np.nan)
+        tangent = np.full((len(q), 2), np.nan)
+        if ok.any():
+            k = seg[ok]
+            foot, tan = segment_points_tangents(self.starts, self.dirs, self.bulge, k, t[ok])
+            rel = q[ok] - foot
+            cross = tan[:, 0] * rel[:, 1] - tan[:, 1] * rel[:, 0]
+            mileage[ok] = self.offset + self.cum[k] + t[ok] * self.seg_len[k]
+            lateral[ok] = np.where(cross < 0, -dist[ok], dist[ok])
+            tangent[ok] = tan
+        return mileage, lateral, tangent
+
+
+class MileageIndex:
+    """
+    里程区间 → 分段序号的查找表。lo, hi 为各分段的起止里程，两端各放宽 tol。
+    区间重叠时序号小的优先，与按图层顺序逐个查找、取第一个命中的规则相同。
+    建立时把全部区间端点排序，预先求出每个“端点 / 端点之间”位置上的命中分段，
+    查询只需一次二分查找。
+    """
+
+    def __init__(self, lo, hi, tol=TOLERANCE):
+        lo = np.asarray(lo, dtype=np.float64).ravel() - tol
+        hi = np.asarray(hi, dtype=np.float64).ravel() + tol
+        self.bounds = np.unique(np.concatenate([lo, hi]))
+        # 位置编号：2i+1 为恰好等于 bounds[i]，2i+2 为 bounds[i] 与 bounds[i+1] 之间，0 为最左侧
+        self.owner = np.full(2 * len(self.bounds) + 1, -1, dtype=np.int64)
+        first = 2 * np.searchsorted(self.bounds, lo) + 1
+        last = 2 * np.searchsorted(self.bounds, hi) + 1
+        for k in range(len(lo) - 1, -1, -1):         # 序号小的后写，覆盖序号大的
+            if lo[k] <= hi[k]:
+                self.owner[first[k]:last[k] + 1] = k
+
+    def lookup(self, mileage):
+        """一批里程 → 分段序号数组，不在任何分段内（或为 NaN）时为 -1。"""
+        m = np.atleast_1d(np.asarray(mileage, dtype=np.float64))
+        if not len(self.bounds):
+            return np.full(len(m), -1, dtype=np.int64)
+        i = np.searchsorted(self.bounds, m, side='right') - 1
+        exact = (i >= 0) & (self.bounds[np.maximum(i, 0)] == m)
+        return self.owner[np.where(exact, 2 * i + 1, 2 * i + 2)]
+
+
+def _oriented(pts, bulge, reverse):
+    if not reverse:
+        return pts, bulge
+    return pts[::-1], -bulge[::-1]
+
+
+def stitch_polylines(polys, bulges=None, tol=STITCH_TOL):
+    """
+    按首尾端点相接（距离不超过 tol）把多条折线连成有序的链，必要时把折线反向。
+    返回 [(pts, bulge, members), ...]，members 为组成该链的 [(折线序号, 是否反向), ...]。
+    第一条折线所在的链保持第一条折线的走向；各链按沿该走向的位置排序并取同一走向，
+    彼此不相接的链之间的空隙不计入长度。
+    """
+    n = len(polys)
+    polys = [as_points(p) for p in polys]
+    bulges = [np.zeros(max(len(p) - 1, 0)) if b is None else np.asarray(b, dtype=np.float64)
+              for p, b in zip(polys, bulges if bulges is not None else [None] * n)]
+    if not n:
+        return []
+
+    # 端点 2k 为第 k 条折线的起点、2k+1 为终点；相距不超过 tol 的端点按距离从近到远两两配对
+    ends = np.array([[p[0], p[-1]] for p in polys]).reshape(-1, 2)
+    qi, si = SegmentGrid(ends, ends, tol).query(ends, ends, tol)
+    keep = qi // 2 < si // 2
+    qi, si = qi[keep], si[keep]
+    gap = np.hypot(*(ends[qi] - ends[si]).T)
+    link = np.full(2 * n, -1)
+    for k in np.flatnonzero(gap <= tol)[np.argsort(gap[gap <= tol], kind='stable')]:
+        a, b = qi[k], si[k]
+        if link[a] < 0 and link[b] < 0:
+            link[a], link[b] = b, a
+
+    # 从空闲端点出发沿配对走出各条链；剩下的折线构成闭合环，从序号最小者的起点断开
+    seen = np.zeros(n, dtype=bool)
+    chains = []
+
+    def walk(k, reverse):
+        members = []
+        while True:
+            seen[k] = True
+            members.append((k, reverse))
+            nxt = link[2 * k + (0 if reverse else 1)]
+            if nxt < 0 or seen[nxt // 2]:
+                return members
+            k, reverse = nxt // 2, bool(nxt % 2)
+
+    for k in range(n):
+        if not seen[k] and (link[2 * k] < 0 or link[2 * k + 1] < 0):
+            chains.append(walk(k, link[2 * k] >= 0))
+    for k in range(n):
+        if not seen[k]:
+            chains.append(walk(k, False))
+
+    # 走向：第一条折线正向；各链按起点沿该走向的投影排序
+    main = next(c for c in chains if any(k == 0 for k, _ in c))
+    if dict(main)[0]:
+        chains[chains.index(main)] = main = [(k, not r) for k, r in reversed(main)]
+    head, tail = ends[2 * main[0][0] + main[0][1]], ends[2 * main[-1][0] + 1 - main[-1][1]]
+    axis = tail - head if np.hypot(*(tail - head)) > tol else polys[0][-1] - polys[0][0]
+
+    def position(chain):
+        return float(ends[2 * chain[0][0] + chain[0][1]] @ axis)
+
+    out = []
+    for chain in chains:
+        if chain is not main:
+            first = ends[2 * chain[0][0] + chain[0][1]]
+            last = ends[2 * chain[-1][0] + 1 - chain[-1][1]]
+            if (last - first) @ axis < 0:
+                chain = [(k, not r) for k, r in reversed(chain)]
+        out.append(chain)
+    out.sort(key=position)
+
+    result = []
+    for chain in out:
+        parts = [_oriented(polys[k], bulges[k], r) for k, r in chain]
+        pts = np.concatenate([parts[0][0]] + [p[1:] for p, _ in parts[1:]])
+        bulge = np.concatenate([b for _, b in parts])
+        result.append((pts, bulge, chain))
+    return result
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+rail_batch.py — 在一个进程内批量处理多张 DXF 图纸。
+
+对命令行给出的 DXF 文件（支持通配符）执行 compute / draw / connect，
+draw 直接用本进程算出的交叉点绘制（rail_power.annotate_crossings，不经表格往返），
+文件之间用进程池并行；最后输出一张合并的交叉表（带 File 列）和逐文件汇总表。
+
+用法示例：
+  python rail_batch.py "sheets/*.dxf" --config corridor.json --steps compute draw --workers 8
+
+配置文件为 JSON：
+  {
+    "rail_layers": {"dl1": 56700, "dl2": 74900},
+    "mileage_file": "mileage_list.txt",
+    "target_point": [553263.2769, 3430423.5097, 0.0],
+    "target_layer": "变电所", "max_target_dist": 5000,
+    "cross_rules": {"电力": "电力", "道路": "道路"},
+    "binary_dxf": true,
+    "files": {"sheet07.dxf": {"rail_layers": {"dl1": 98000}}}
+  }
+- rail_layers：铁路图层及其起始里程偏置，缺省取 rail_power.RAIL_LAYERS
+- mileage_file / target_point：connect 步骤使用，缺省取 mileage_connect 中的配置
+- target_file / target_layer / max_target_dist：connect 的多目标模式，每个里程连接到最近的目标点
+  （目标点表格，或各图纸中该图层的点 / 图块），缺省取 mileage_connect 中的配置
+- cross_rules：交叉类别规则（图层前缀 → 类别），缺省取 rail_power.CROSS_RULES
+- binary_dxf：经底图的二进制副本读取，draw / connect 输出二进制 DXF（见 rail_binary.py），缺省 false
+- files：可选，按文件名覆盖以上设置
+配置中 mileage_file / target_file 的相对路径相对配置文件所在目录；表格读取失败只记入用到它的文件的 Error 列。
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import rail_power
+import mileage_connect
+from rail_table import write_table
+
+STEPS = ('compute', 'draw', 'connect')
+
+
+def expand_inputs(patterns):
+    """展开文件名或通配符，按出现顺序去重。"""
+    files = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for name in matches:
+            path = Path(name)
+            if path not in files:
+                files.append(path)
+    return files
+
+
+def load_config(config_path):
+    """读取 JSON 配置，补齐缺省值；配置中的相对表格路径按配置文件所在目录解析。"""
+    config = {}
+    if config_path:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        base = Path(config_path).parent
+        for section in [config, *config.get('files', {}).values()]:
+            for key in ('mileage_file', 'target_file'):
+                if section.get(key):
+                    section[key] = str(base / section[key])
+    config.setdefault('rail_layers', rail_power.RAIL_LAYERS)
+    config.setdefault('mileage_file', mileage_connect.MILEAGE_FILE)
+    config.setdefault('target_point', mileage_connect.TARGET_POINT)
+    config.setdefault('target_file', mileage_connect.TARGET_FILE)
+    config.setdefault('target_layer', mileage_connect.TARGET_LAYER)
+    config.setdefault('max_target_dist', mileage_connect.MAX_TARGET_DIST)
+    config.setdefault('cross_rules', rail_power.CROSS_RULES)
+    config.setdefault('binary_dxf', False)
+    config.setdefault('files', {})
+    return config
+
+
+def file_settings(config, dxf_path):
+    """取某个文件的设置：全局设置 + files 中按文件名的覆盖项。"""
+    settings = {k: v for k, v in config.items() if k != 'files'}
+    settings.update(config['files'].get(dxf_path.name, {}))
+    return settings
+
+
+def process_file(dxf_path, steps, settings):
+    """对单个文件执行各步骤，返回 (汇总, 交叉行)。出错时记录在汇总的 Error 列，不中断批处理。"""
+    summary = {'File': str(dxf_path), 'Crossings': None, 'Annotated': None,
+               'Connected': None, 'Seconds': None, 'Error': ''}
+    rows = []
+    t0 = time.perf_counter()
+    try:
+        rail_layers = settings['rail_layers']
+        if 'draw' in steps:
+            # 求交与标注一体完成：底图只读一次，角度以全精度传给绘制
+            result = rail_power.annotate_crossings(dxf_path, rail_layers, workers=1,
+                                                   rules=settings['cross_rules'],
+                                                   binary=settings['binary_dxf'])
+            if result is not None:
+                rows, stats = result
+                summary['Annotated'] = stats['placed']
+            summary['Crossings'] = len(rows)
+        elif 'compute' in steps:
+            rows = rail_power.find_crossings(dxf_path, rail_layers, workers=1,
+                                             rules=settings['cross_rules'],
+                                             binary=settings['binary_dxf']) or []
+            summary['Crossings'] = len(rows)
+        if 'connect' in steps:
+            for key in ('mileages', 'targets'):
+                if isinstance(settings.get(key), Exception):
+                    raise settings[key]
+            targets = settings.get('targets')
+            if targets is None:
+                targets = mileage_connect.load_targets(dxf_path, None, settings['target_layer'])
+            summary['Connected'] = mileage_connect.connect(
+                dxf_path, settings['mileages'], rail_layers, settings['target_point'],
+                binary=settings['binary_dxf'], targets=targets, max_dist=settings['max_target_dist'])
+    except Exception as e:
+        summary['Error'] = f'{type(e).__name__}: {e}'
+    summary['Seconds'] = round(time.perf_counter() - t0, 3)
+    return summary, [{'File': str(dxf_path), **r} for r in rows]
+
+
+def _read_once(tables, reader, path):
+    """同一表格只读一次；读取失败时记下异常本身，由用到该表格的文件在 process_file 中记入 Error 列。"""
+    if path not in tables:
+        try:
+            tables[path] = reader(Path(path))
+        except Exception as e:
+            tables[path] = e
+    return tables[path]
+
+
+def run_batch(files, steps, config, workers=1):
+    """批量处理 files，结果按输入顺序返回 (汇总列表, 全部交叉行)。"""
+    jobs = [(path, steps, file_settings(config, path)) for path in files]
+    if 'connect' in steps:
+        # 里程表和目标点表格按各文件自己的设置取用（files 中可覆盖），同一表格只读一次
+        mileages, targets = {}, {}
+        for _, _, settings in jobs:
+            settings['mileages'] = _read_once(mileages, mileage_connect.read_mileages,
+                                              settings['mileage_file'])
+            if settings['target_file']:
+                settings['targets'] = _read_once(targets, mileage_connect.read_targets,
+                                                 settings['target_file'])
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(process_file, *zip(*jobs)))
+    else:
+        results = [process_file(*job) for job in jobs]
+    summaries = [s for s, _ in results]
+    rows = [r for _, file_rows in results for r in file_rows]
+    return summaries, rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量处理多张 DXF 图纸')
+    parser.add_argument('inputs', nargs='+', help='DXF 文件或通配符，如 "sheets/*.dxf"')
+    parser.add_argument('--config', help='JSON 配置文件（铁路图层、里程偏置等）')
+    parser.add_argument('--steps', nargs='+', choices=STEPS, default=['compute'],
+                        help='要执行的步骤，缺省只计算交叉点')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行处理的文件数（0 为全部 CPU 核心）')
+    parser.add_argument('--out', default='rail_batch_crossings.xlsx',
+                        help='合并交叉表路径（.xlsx / .csv / .parquet / .feather）')
+    parser.add_argument('--summary', default='rail_batch_summary.csv',
+                        help='逐文件汇总表路径（.xlsx / .csv / .parquet / .feather）')
+    args = parser.parse_args(argv)
+
+    files = expand_inputs(args.inputs)
+    missing = [p for p in files if not p.exists()]
+    for p in missing:
+        print('DXF 文件未找到：', p)
+    files = [p for p in files if p.exists()]
+    if not files:
+        return
+
+    config = load_config(args.config)
+    workers = args.workers or os.cpu_count() or 1
+    summaries, rows = run_batch(files, args.steps, config, workers)
+
+    if 'compute' in args.steps:
+        write_table(rows, args.out, ['File'] + rail_power.COLUMNS)
+        print(f"[OK] 合并交叉表 → {args.out}（{len(rows)} 行）")
+    write_table(summaries, args.summary, list(summaries[0]))
+    failed = sum(1 for s in summaries if s['Error'])
+    print(f"[OK] 汇总 → {args.summary}（{len(summaries)} 个文件，失败 {failed} 个）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+rail_bench.py — 合成走廊图纸生成器与性能基准。
+
+生成器按给定规模写出 DXF：dl1…dlN 图层上共 km 公里的铁路中心线（随机游走折线，
+按图层首尾相接），若干条 “电力--电压线路--编号” 图层上横穿铁路的电力折线，
+以及可选的 TEXT/HATCH 噪声实体。
+
+基准对每个规模生成一张图纸，分别计时：
+- compute_cold / compute_warm：rail_power.compute()，铁路缓存为空 / 已命中
+- load_stream / load_parallel：rail_loader 流式读取与按字节段并行解析铁路和电力图层的折线
+- densify：全部铁路折线加密（DENSIFY_LEN）
+- calc_mileage：随机点投影求里程（逐段扫描）；alignment_build / alignment_project：
+  建立 Alignment 线段索引、用索引反算同一批点
+- point_and_tangent：逐个调用 point_and_tangent；points_and_tangents：同一批查询一次调用
+- draw / connect：rail_power_draw.annotate() 与 mileage_connect.connect()
+每项重复 --repeat 次取最小值，结果连同版本信息写成 JSON；
+给出 --baseline 时与旧结果逐项对比，变慢超过 --threshold 倍的项目标为回退。
+
+用法示例：
+  python rail_bench.py --sizes 10x50 50x200 200x1000 --noise 2000 --out bench.json
+  python rail_bench.py --baseline bench_old.json --out bench_new.json
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import ezdxf
+import numpy as np
+
+import rail_cache
+import rail_power
+import rail_power_draw
+import mileage_connect
+from rail_alignment import Alignment
+from rail_geom import poly2d, densify, calc_cum_len, calc_mileage, point_and_tangent, points_and_tangents
+from rail_loader import group_polylines, load_polylines, load_polylines_parallel
+
+SIZES      = ['10x50', '50x200', '200x1000']   # 规模：铁路公里数 x 电力折线条数
+N_LAYERS   = 6               # 铁路图层数（dl1…dlN）
+NOISE      = 0               # TEXT、HATCH 噪声实体各多少个
+REPEAT     = 3               # 每项重复次数，取最小值
+N_QUERIES  = 10000           # calc_mileage / alignment_project / points_and_tangents 的查询点数
+N_SCALAR   = 1000            # point_and_tangent 逐个调用的次数
+THRESHOLD  = 1.2             # 与 baseline 对比时判定回退的倍数
+SEED       = 1
+DENSIFY_LEN = 5.0            # densify 计时使用的加密阈值（米）
+
+
+# ---------- 生成器 --------------------------------------------------
+def make_corridor(path, km, n_power, noise=0, n_layers=N_LAYERS, seed=SEED):
+    """
+    写出合成走廊图纸 path，返回 {铁路图层: 里程偏置}（各图层首尾相接，偏置为前面图层长度之和）。
+    """
+    rng = random.Random(seed)
+    doc = ezdxf.new('R2010')
+    msp = doc.modelspace()
+
+    # 铁路：随机游走，每段 10–120 m，航向缓慢变化
+    x, y, heading = 500000.0, 3400000.0, 0.3
+    rail = [(x, y)]
+    length = 0.0
+    while length < km * 1000:
+        heading += rng.uniform(-0.02, 0.02)
+        step = rng.uniform(10, 120)
+        x, y = x + step * math.cos(heading), y + step * math.sin(heading)
+        rail.append((x, y))
+        length += step
+
+    rail_layers = {}
+    cuts = np.linspace(0, len(rail) - 1, n_layers + 1).astype(int)
+    offset = 0.0
+    for k in range(n_layers):
+        name = f'dl{k + 1}'
+        pts = rail[cuts[k]:cuts[k + 1] + 1]
+        doc.layers.add(name)
+        msp.add_lwpolyline(pts, dxfattribs={'layer': name})
+        rail_layers[name] = round(offset, 3)
+        offset += float(calc_cum_len(pts)[-1])
+
+    # 电力：以铁路上随机一点为中心的三点折线，长 600–1800 m
+    for k in range(n_power):
+        cx, cy = rail[rng.randrange(1, len(rail) - 1)]
+        a = rng.uniform(0, math.pi)
+        half = rng.uniform(300, 900)
+        p1 = (cx - half * math.cos(a), cy - half * math.sin(a))
+        p2 = (cx + half * math.cos(a), cy + half * math.sin(a))
+        mid = ((p1[0] + p2[0]) / 2 + rng.uniform(-50, 50), (p1[1] + p2[1]) / 2 + rng.uniform(-50, 50))
+        name = f'电力--{rng.choice(["10kV", "35kV", "110kV"])}线路{k % 50}--{k // 50}'
+        if name not in doc.layers:
+            doc.layers.add(name)
+        msp.add_lwpolyline([p1, mid, p2], dxfattribs={'layer': name})
+
+    # 噪声：房屋图层上的文字和填充
+    if noise:
+        doc.layers.add('房屋')
+        for k in range(noise):
+            cx, cy = rail[rng.randrange(len(rail))]
+            cx, cy = cx + rng.uniform(-500, 500), cy + rng.uniform(-500, 500)
+            msp.add_text(f'房屋{k}', dxfattribs={'layer': '房屋', 'insert': (cx, cy)})
+            hatch = msp.add_hatch(dxfattribs={'layer': '房屋'})
+            hatch.paths.add_polyline_path([(cx, cy), (cx + 20, cy), (cx + 20, cy + 15), (cx, cy + 15)])
+
+    doc.saveas(path)
+    return rail_layers
+
+
+# ---------- 计时 ----------------------------------------------------
+def best_of(func, repeat=REPEAT):
+    """重复调用 func，返回 (最短耗时秒数, 最后一次的返回值)。"""
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_size(work_dir, km, n_power, noise=NOISE, repeat=REPEAT):
+    """在 work_dir 中生成一张图纸并逐项计时，返回该规模的结果字典。"""
+    path = Path(work_dir) / f'corridor_{km}km_{n_power}.dxf'
+    t0 = time.perf_counter()
+    rail_layers = make_corridor(path, km, n_power, noise)
+    generate = time.perf_counter() - t0
+
+    cache_dir = Path(work_dir) / f'cache_{km}_{n_power}'
+    rail_cache.CACHE_DIR = cache_dir
+    rail_power.RAIL_LAYERS = rail_layers
+    timings = {}
+
+    def cold():
+        for p in cache_dir.glob('*.npz'):
+            p.unlink()
+        return rail_power.compute(path)
+
+    timings['compute_cold'], _ = best_of(cold, repeat)
+    timings['compute_warm'], _ = best_of(lambda: rail_power.compute(path), repeat)
+    rows = rail_power.find_crossings(path) or []
+
+    def wanted(name):
+        return name in rail_layers or name.startswith('电力')
+    timings['load_stream'], _ = best_of(lambda: load_polylines(path, wanted), repeat)
+    timings['load_parallel'], _ = best_of(lambda: load_polylines_parallel(path, wanted), repeat)
+
+    doc = ezdxf.readfile(path)
+    layer_polys = group_polylines(doc.modelspace(), lambda name: name in rail_layers)
+    raw = [poly2d(e) for name in rail_layers for e in layer_polys.get(name, [])]
+    timings['densify'], dense = best_of(
+        lambda: [densify(pts, DENSIFY_LEN) for pts in raw], repeat)
+
+    # 查询集中在第一条加密后的铁路上
+    rng = np.random.default_rng(SEED)
+    pts = dense[0]
+    cum = calc_cum_len(pts)
+    xy = pts[rng.integers(0, len(pts), N_QUERIES)] + rng.uniform(-20, 20, (N_QUERIES, 2))
+    lens = rng.uniform(0, cum[-1], N_QUERIES)
+    timings['calc_mileage'], _ = best_of(lambda: calc_mileage(pts, cum, xy, 0.0), repeat)
+    timings['alignment_build'], alignment = best_of(lambda: Alignment(pts, cum=cum), repeat)
+    timings['alignment_project'], _ = best_of(lambda: alignment.project(xy), repeat)
+    timings['point_and_tangent'], _ = best_of(
+        lambda: [point_and_tangent(pts, cum, L) for L in lens[:N_SCALAR]], repeat)
+    timings['points_and_tangents'], _ = best_of(lambda: points_and_tangents(pts, cum, lens), repeat)
+
+    mileages = [r['Mileage_m'] for r in rows]
+    angles = [r['Angle'] for r in rows]
+    target = (*pts[len(pts) // 2], 0.0)
+    timings['draw'], stats = best_of(lambda: rail_power_draw.annotate(
+        path, mileages, angles, rail_layers, path.with_name(path.stem + '_draw.dxf')), repeat)
+    timings['connect'], connected = best_of(lambda: mileage_connect.connect(
+        path, mileages, rail_layers, target, path.with_name(path.stem + '_connect.dxf')), repeat)
+
+    return {
+        'size': f'{km}x{n_power}',
+        'km': km,
+        'power_lines': n_power,
+        'noise': noise,
+        'file_bytes': path.stat().st_size,
+        'generate_s': round(generate, 4),
+        'counts': {
+            'rail_vertices': sum(len(p) for p in raw),
+            'dense_vertices': sum(len(p) for p in dense),
+            'crossings': len(rows),
+            'annotated': stats['placed'],
+            'connected': connected,
+        },
+        'timings_s': {k: round(v, 6) for k, v in timings.items()},
+    }
+
+
+def version_info():
+    """记录被测代码与运行环境的版本，便于跨版本对比。"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'ezdxf': ezdxf.__version__,
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """逐规模、逐项与旧结果对比，打印耗时比值，返回回退项列表 [(规模, 项目, 比值)]。"""
+    old = {r['size']: r['timings_s'] for r in baseline.get('results', [])}
+    slower = []
+    for r in results:
+        base = old.get(r['size'])
+        if base is None:
+            continue
+        for name, t in r['timings_s'].items():
+            if name not in base or base[name] <= 0:
+                continue
+            ratio = t / base[name]
+            flag = '  <-- 回退' if ratio > threshold else ''
+            print(f"  {r['size']:>10} {name:<20} {base[name]:>10.4f}s → {t:>10.4f}s  ×{ratio:.2f}{flag}")
+            if ratio > threshold:
+                slower.append((r['size'], name, ratio))
+    return slower
+
+
+def parse_size(text):
+    km, n_power = text.lower().split('x')
+    return float(km) if '.' in km else int(km), int(n_power)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='合成走廊图纸性能基准')
+    parser.add_argument('--sizes', nargs='+', default=SIZES,
+                        help='规模列表，形如 10x50（铁路公里数 x 电力折线条数）')
+    parser.add_argument('--noise', type=int, default=NOISE, help='TEXT、HATCH 噪声实体各多少个')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='每项重复次数，取最小值')
+    parser.add_argument('--out', default='rail_bench.json', help='结果 JSON 路径')
+    parser.add_argument('--baseline', help='旧结果 JSON，给出时逐项对比')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='判定回退的耗时倍数')
+    parser.add_argument('--keep', help='生成的图纸保存到此目录（缺省用临时目录，结束后删除）')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = Path(args.keep) if args.keep else Path(tmp)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        for text in args.sizes:
+            km, n_power = parse_size(text)
+            print(f"[基准] {km} km 铁路，{n_power} 条电力线 …")
+            result = bench_size(work_dir, km, n_power, args.noise, args.repeat)
+            for name, t in result['timings_s'].items():
+                print(f"  {name:<20} {t:>10.4f}s")
+            results.append(result)
+
+    report = {'version': version_info(), 'repeat': args.repeat, 'results': results}
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[OK] 基准结果 → {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            slower = compare(results, json.load(f), args.threshold)
+        print(f"[对比] 变慢超过 {args.threshold} 倍的项目：{len(slower)} 个")
+
+
+if __name__ == '__main__':
+    main()
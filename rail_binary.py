@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_binary.py — 二进制 DXF 的快速扫描与底图的二进制副本
+# 1) scan_tags 按组码类型直接跳过值的字节，只给出每个标签的位置；需要时才解码取值，
+#    不关心的实体不构造任何对象，也没有 ASCII 格式逐行拆分、数值转换的开销
+# 2) to_binary 把 ASCII DXF 逐标签转写为二进制 DXF，组码、句柄和标签顺序原样保留，不经过 ezdxf 文档模型
+# 3) sidecar 在 rail_cache 缓存目录中按内容哈希保存底图的二进制副本，图纸不变时以后的运行直接读副本
+# 4) 只处理 R2000 及以后版本（2 字节组码）；R12 由调用方退回 ASCII 或 ezdxf.readfile
+
+import hashlib
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+from ezdxf.filemanagement import dxf_file_info
+from ezdxf.lldxf.const import DXFStructureError
+from ezdxf.lldxf.tagger import ascii_tags_loader
+from ezdxf.lldxf.tagwriter import BinaryTagWriter
+from ezdxf.lldxf.types import (BINARY_DATA, BYTES, DOUBLE, INT16, INT32, INT64, MAX_GROUP_CODE,
+                               POINT_CODES, DXFBinaryTag, DXFTag, DXFVertex)
+from ezdxf.lldxf.validator import binary_dxf_info
+
+import rail_cache
+import rail_profile
+
+SIGNATURE       = b'AutoCAD Binary DXF\r\n\x1a\x00'
+SIDECAR_VERSION = 1          # 副本格式版本，转写规则变化时递增使旧副本失效
+
+
+def _value_sizes():
+    """各组码的值长度：正数为定长字节数，0 为以 0 结尾的字符串，-1 为 1 字节长度前缀的二进制块。"""
+    sizes = [0] * (MAX_GROUP_CODE + 1)
+    for codes, size in ((BYTES, 1), (INT16, 2), (INT32, 4), (INT64, 8), (DOUBLE, 8), (BINARY_DATA, -1)):
+        for code in codes:
+            sizes[code] = size
+    return sizes
+
+
+_SIZES = _value_sizes()
+
+
+def is_binary(path):
+    """文件是否为二进制 DXF。"""
+    with open(path, 'rb') as f:
+        return f.read(len(SIGNATURE)) == SIGNATURE
+
+
+def _encoding(info):
+    # R2007 起文本一律为 UTF-8，$DWGCODEPAGE 只对更早的版本有效
+    return 'utf8' if info.version >= 'AC1021' else info.encoding
+
+
+def binary_version(data):
+    """二进制 DXF 数据的版本号（如 'AC1032'）和文本编码。"""
+    info = binary_dxf_info(data)
+    return info.version, _encoding(info)
+
+
+def scan_tags(data, pos=len(SIGNATURE)):
+    """
+    从 pos 起逐个扫描 R2000+ 二进制 DXF 的标签，产出 (组码, 值起点, 值终点, 下一标签起点)，
+    字符串的值终点不含结尾的 0。标签起点为值起点 - 2（二进制块为 - 3）。
+    """
+    sizes = _SIZES
+    find = data.find
+    end = len(data)
+    try:
+        while pos < end:
+            code = data[pos] | data[pos + 1] << 8
+            start = pos + 2
+            size = sizes[code]
+            if size > 0:
+                pos = start + size
+                yield code, start, pos, pos
+            elif size == 0:
+                stop = find(b'\x00', start)
+                if stop < 0:
+                    raise DXFStructureError(f'字符串没有结尾（位置 {start}）')
+                pos = stop + 1
+                yield code, start, stop, pos
+            else:
+                pos = start + 1 + data[start]
+                yield code, start + 1, pos, pos
+    except IndexError:
+        raise DXFStructureError(f'二进制 DXF 标签无法识别（位置 {pos}）')
+
+
+def tag_value(data, code, start, stop, encoding):
+    """解码单个标签的值：字符串、int、float 或 bytes（二进制块）。"""
+    size = _SIZES[code]
+    if size == 0:
+        return data[start:stop].decode(encoding, errors='surrogateescape')
+    if size < 0:
+        return data[start:stop]
+    if code in DOUBLE:
+        return struct.unpack_from('<d', data, start)[0]
+    return int.from_bytes(data[start:stop], 'little', signed=code not in BYTES)
+
+
+def decode_tags(data, positions, encoding):
+    """
+    把 scan_tags 给出的一段 (组码, 值起点, 值终点, …) 解码为 DXFTag 列表，
+    x/y(/z) 坐标合并为 DXFVertex，与 ezdxf 的 tag_compiler 结果相同，可直接构造 ExtendedTags。
+    """
+    tags = []
+    k, n = 0, len(positions)
+    while k < n:
+        code, start, stop = positions[k][:3]
+        if code in POINT_CODES and k + 1 < n and positions[k + 1][0] == code + 10:
+            dim = 3 if k + 2 < n and positions[k + 2][0] == code + 20 else 2
+            tags.append(DXFVertex(code, struct.unpack_from('<d', data, start) +
+                                  tuple(struct.unpack_from('<d', data, positions[k + j][1])[0]
+                                        for j in range(1, dim))))
+            k += dim
+            continue
+        value = tag_value(data, code, start, stop, encoding)
+        tags.append(DXFBinaryTag(code, value) if code in BINARY_DATA else DXFTag(code, value))
+        k += 1
+    return tags
+
+
+def to_binary(src_path, out_path):
+    """把 ASCII DXF 逐标签转写为二进制 DXF。R12 及更早版本不支持，抛出 ValueError。"""
+    info = dxf_file_info(src_path)
+    if info.version <= 'AC1009':
+        raise ValueError(f'DXF 版本 {info.version} 使用 1 字节组码，不转写')
+    encoding = _encoding(info)
+    with open(src_path, 'rt', encoding=encoding, errors='surrogateescape') as src, \
+            open(out_path, 'wb') as out:
+        writer = BinaryTagWriter(out, info.version, encoding=encoding)
+        writer.write_signature()
+        write = writer.write_tag2
+        for code, value in ascii_tags_loader(src, skip_comments=True):
+            if code in BINARY_DATA:
+                value = bytes.fromhex(value.strip())
+            elif code == 0 or _SIZES[code]:
+                value = value.strip()
+            write(code, value)
+
+
+def sidecar(dxf_path, digest=None):
+    """
+    返回可代替 dxf_path 读取的二进制 DXF：dxf_path 本身是二进制时原样返回；
+    否则取缓存目录中按内容哈希（digest，缺省现算）命名的副本，没有时转写生成。
+    R12 等无法转写的图纸返回 dxf_path。
+    """
+    dxf_path = Path(dxf_path)
+    if is_binary(dxf_path):
+        return dxf_path
+    digest = digest or rail_cache.file_digest(dxf_path)
+    key = f'{SIDECAR_VERSION}|{digest}'
+    path = rail_cache.CACHE_DIR / (hashlib.sha1(key.encode('utf-8')).hexdigest() + '.bin.dxf')
+    try:
+        os.utime(path)               # 记录最近使用时间，供淘汰使用
+        return path
+    except OSError:                  # 还没有副本，或刚被其他进程淘汰：重新转写
+        pass
+    if dxf_file_info(dxf_path).version <= 'AC1009':
+        return dxf_path
+
+    with rail_profile.stage('binary_sidecar'):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+        os.close(fd)
+        try:
+            to_binary(dxf_path, tmp)
+            os.replace(tmp, path)
+        except OSError:
+            return dxf_path
+        finally:
+            if os.path.exists(tmp):        # 转写失败（含 ValueError、DXFStructureError 等）时不留下临时文件
+                os.remove(tmp)
+    rail_cache.evict(keep=path)
+    return path if path.exists() else dxf_path
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_cache.py — 铁路中心线预处理结果的磁盘缓存
+# 1) 每个铁路图层的点列、线段凸度和累积长度存为一个 .npz 文件；
+#    同一图层的多条折线先按首尾端点拼接为有序分段（见 rail_alignment.stitch_polylines），
+#    各分段的累积长度首尾相接，即整条图层线路的里程
+# 2) 缓存键 = DXF 内容哈希 + 图层 + 加密阈值 + 里程偏置，实体句柄随数据一起保存
+# 3) 目录总大小超过上限时按最近使用时间淘汰，适合放在共享网络目录；
+#    rail_binary.py 的底图二进制副本也放在同一目录、一起淘汰
+
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from rail_geom import poly2d, poly_bulge, densify, calc_cum_len
+from rail_alignment import STITCH_TOL, stitch_polylines
+import rail_profile
+
+CACHE_DIR       = Path(os.environ.get('RAIL_CACHE_DIR',
+                                      Path.home() / '.cache' / 'dxf-mileage-tool'))
+CACHE_MAX_BYTES = int(float(os.environ.get('RAIL_CACHE_MAX_MB', 512)) * 1024 * 1024)
+CACHE_VERSION   = 3          # 缓存格式版本，格式变化时递增使旧缓存失效
+
+
+def file_digest(path):
+    """计算文件内容的 SHA-256（十六进制）。"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _entry_path(digest, layer, max_seg_len, offset):
+    key = f'{CACHE_VERSION}|{digest}|{layer}|{max_seg_len!r}|{offset!r}|{STITCH_TOL!r}'
+    return CACHE_DIR / (hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+
+def _load_entry(path):
+    """读取单个缓存文件，返回 [(handle, pts, cum, bulge), ...]；文件损坏时视为未命中。"""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            bounds = data['bounds']
+            pts, cum, bulge, handles = data['pts'], data['cum'], data['bulge'], data['handles']
+            items = [(str(handles[k]), pts[bounds[k]:bounds[k + 1]], cum[bounds[k]:bounds[k + 1]],
+                      bulge[bounds[k]:bounds[k + 1] - 1])
+                     for k in range(len(handles))]
+    except (OSError, KeyError, ValueError):
+        return None
+    try:
+        os.utime(path)               # 记录最近使用时间，供淘汰使用
+    except OSError:                  # 读取后已被其他进程淘汰，数据照样可用
+        pass
+    return items
+
+
+def _save_entry(path, items):
+    """原子写入单个缓存文件，然后检查目录大小。"""
+    sizes = [len(pts) for _, pts, _, _ in items]
+    bounds = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    # 凸度按线段存储，每条折线末尾补一个 0，与点列共用 bounds
+    data = {
+        'handles': np.array([h for h, _, _, _ in items], dtype=str),
+        'bounds': bounds,
+        'pts': np.concatenate([pts for _, pts, _, _ in items] or [np.empty((0, 2))]),
+        'cum': np.concatenate([cum for _, _, cum, _ in items] or [np.empty(0)]),
+        'bulge': np.concatenate([np.append(b, 0.0)[:len(pts)] for _, pts, _, b in items]
+                                or [np.empty(0)]),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **data)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    evict(keep=path)
+
+
+def evict(max_bytes=None, keep=None):
+    """
+    目录总大小超过 max_bytes 时，按最近使用时间从旧到新删除缓存文件（含二进制 DXF 副本）；
+    keep 为刚写入、调用方马上要用的文件，即使它本身超过上限也不删除。
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    keep = Path(keep) if keep is not None else None
+    files = []
+    for p in [*CACHE_DIR.glob('*.npz'), *CACHE_DIR.glob('*.bin.dxf')]:
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        files.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in files)
+    for _, size, p in sorted(files):
+        if total <= max_bytes:
+            break
+        if p == keep:
+            continue
+        try:
+            p.unlink()
+            total -= size
+        except OSError:
+            pass
+
+
+def cached_rails(digest, rail_layers, max_seg_len):
+    """
+    从缓存取各铁路图层的预处理结果，只返回命中的图层：
+    {图层: [(handle, pts, cum, bulge), ...]}，列表按里程顺序排列，拼接而成的分段 handle 为
+    各折线句柄以 '+' 相连。digest 为 None 表示不使用缓存。
+    """
+    rails = {}
+    if digest is None:
+        return rails
+    for layer, offset in rail_layers.items():
+        path = _entry_path(digest, layer, max_seg_len, offset)
+        if path.exists():
+            items = _load_entry(path)
+            if items is not None:
+                rails[layer] = items
+    return rails
+
+
+@rail_profile.timed('prepare_rails')
+def prepare_rails(layer_polys, names, rail_layers, max_seg_len, digest):
+    """
+    对 names 中的铁路图层拼接折线并现算点列、凸度与累积长度，digest 不为 None 时写入缓存；
+    没有折线的图层也记录为空，下次无需再查。
+    max_seg_len 为 None 时保留原始直线/圆弧图元；给出时沿图元加密为弦，凸度全部为 0。
+    """
+    rails = {}
+    for layer in names:
+        handles, polys, bulges = [], [], []
+        for ent in layer_polys.get(layer, []):
+            pts = poly2d(ent)
+            if len(pts) > 1:
+                handles.append(ent.dxf.handle)
+                polys.append(pts)
+                bulges.append(poly_bulge(ent))
+        items = []
+        start = 0.0
+        for pts, bulge, members in stitch_polylines(polys, bulges, STITCH_TOL):
+            if max_seg_len is not None:
+                pts = densify(pts, max_seg_len, bulge)
+                bulge = np.zeros(max(len(pts) - 1, 0))
+                rail_profile.count('densify_segments', len(bulge))
+            cum = calc_cum_len(pts, bulge) + start
+            start = cum[-1]
+            items.append(('+'.join(str(handles[k]) for k, _ in members), pts, cum, bulge))
+        rails[layer] = items
+        if digest is not None:
+            _save_entry(_entry_path(digest, layer, max_seg_len, rail_layers[layer]), items)
+    return rails
@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_geom.py — 三个脚本共用的折线几何内核（基于 NumPy 数组）
+# 1) 折线统一表示为连续的 float64 (N, 2) 数组，不再构造 Vec2 列表
+# 2) 加密、累积长度、点到折线投影、切线计算均为向量化的批量运算
+# 3) 折线求交直接给出所在线段序号与参数，便于后续取里程和方向
+# 4) 带凸度的线段按圆弧图元处理：长度、定位、切线、投影、求交均为解析计算，不再切成弦
+
+import numpy as np
+
+TOLERANCE  = 1e-6            # 几何容差
+CHUNK_SIZE = 1_000_000       # 批量运算时单块最多处理的 (点 × 线段) 组合数
+ARC_EPS    = 1e-9            # |凸度| 不超过此值的线段按直线处理
+
+
+# ---------- 基础构造 ------------------------------------------------
+def as_points(points):
+    """把任意点序列转换为连续的 float64 (N, 2) 数组（只取 X、Y）。"""
+    arr = np.asarray(points, dtype=np.float64)
+    if arr.ndim != 2 or arr.shape[1] < 2:
+        arr = arr.reshape(-1, 2)
+    return np.ascontiguousarray(arr[:, :2])
+
+
+def poly2d(entity):
+    """把 LWPOLYLINE/POLYLINE（或 rail_loader.PolylineData）投影为 (N, 2) 坐标数组。"""
+    if hasattr(entity, 'xy'):           # 已解析的顶点数组
+        return as_points(entity.xy)
+    kind = entity.dxftype()
+    if kind == 'LWPOLYLINE':
+        pts = entity.get_points('xy')
+    elif kind == 'POLYLINE':
+        pts = [(v.x, v.y) for v in entity.points()]
+    else:
+        raise TypeError(f'Unsupported entity type: {kind}')
+    return as_points(pts)
+
+
+def poly_bulge(entity):
+    """返回 LWPOLYLINE/POLYLINE 各线段（顶点 k → k+1）的凸度 (N-1,)，0 为直线段。"""
+    if hasattr(entity, 'xy'):
+        return np.asarray(entity.bulge[:-1], dtype=np.float64)
+    kind = entity.dxftype()
+    if kind == 'LWPOLYLINE':
+        bulge = [p[2] for p in entity.get_points('xyb')]
+    elif kind == 'POLYLINE':
+        bulge = [v.dxf.bulge for v in entity.vertices]
+    else:
+        raise TypeError(f'Unsupported entity type: {kind}')
+    return np.asarray(bulge[:-1], dtype=np.float64)
+
+
+def _bulge(bulge, n):
+    """把可选的凸度参数整理为长度 n 的数组（None 表示全部为直线）。"""
+    if bulge is None:
+        return np.zeros(n)
+    return np.asarray(bulge, dtype=np.float64).ravel()[:n]
+
+
+# ---------- 圆弧图元 ------------------------------------------------
+def arc_geometry(starts, dirs, bulge):
+    """
+    由线段起点、弦向量和凸度求圆弧参数，返回 (center, radius, start_angle, sweep)：
+    圆心 (K, 2)、半径、起点极角、圆心角（逆时针为正）。直线段对应的行无意义。
+    """
+    b = np.asarray(bulge, dtype=np.float64)
+    b = np.where(np.abs(b) > ARC_EPS, b, 1.0)
+    chord = np.hypot(dirs[:, 0], dirs[:, 1])
+    # 圆心 = 弦中点 + 左法向 × (1 - b²) / (4b)；半径 = 弦长 × (1 + b²) / (4|b|)
+    k = (1.0 - b * b) / (4.0 * b)
+    center = starts + dirs * 0.5 + np.column_stack([-dirs[:, 1], dirs[:, 0]]) * k[:, None]
+    radius = chord * (1.0 + b * b) / (4.0 * np.abs(b))
+    rel = starts - center
+    start_angle = np.arctan2(rel[:, 1], rel[:, 0])
+    sweep = 4.0 * np.arctan(np.asarray(bulge, dtype=np.float64))
+    return center, radius, start_angle, sweep
+
+
+def segment_lengths(dirs, bulge=None):
+    """各线段长度：直线为弦长，圆弧为弧长。"""
+    d = np.asarray(dirs, dtype=np.float64).reshape(-1, 2)
+    length = np.hypot(d[:, 0], d[:, 1])
+    b = _bulge(bulge, len(d))
+    arc = np.abs(b) > ARC_EPS
+    if arc.any():
+        theta = 4.0 * np.arctan(b[arc])
+        length[arc] = length[arc] * (1.0 + b[arc] ** 2) / (4.0 * np.abs(b[arc])) * np.abs(theta)
+    return length
+
+
+def segment_points_tangents(starts, dirs, bulge, idx, t):
+    """
+    在线段 idx 上按长度比例 t（0–1）取点和切线单位向量，直线、圆弧均可。
+    返回 (pts, tangents)，均为 (K, 2) 数组。
+    """
+    idx = np.asarray(idx, dtype=np.int64)
+    t = np.asarray(t, dtype=np.float64)
+    a, d = starts[idx], dirs[idx]
+    pt = a + d * t[:, None]
+    tan = unit(d)
+    b = _bulge(bulge, len(starts))[idx] if bulge is not None else None
+    if b is not None:
+        arc = np.abs(b) > ARC_EPS
+        if arc.any():
+            center, radius, alpha, sweep = arc_geometry(a[arc], d[arc], b[arc])
+            phi = alpha + sweep * t[arc]
+            c, s = np.cos(phi), np.sin(phi)
+            pt[arc] = center + radius[:, None] * np.column_stack([c, s])
+            sign = np.sign(sweep)[:, None]
+            tan[arc] = sign * np.column_stack([-s, c])
+    return pt, tan
+
+
+def arc_fraction(center, radius, start_angle, sweep, xy, tol=TOLERANCE):
+    """
+    点 xy（位于圆上）在圆弧上的长度比例，超出圆弧（放宽 tol 距离）时为 NaN。
+    各参数可为标量或等长数组。
+    """
+    rel = np.asarray(xy, dtype=np.float64).reshape(-1, 2) - center
+    ang = (np.arctan2(rel[:, 1], rel[:, 0]) - start_angle) * np.sign(sweep)
+    ang = np.mod(ang, 2 * np.pi)
+    span = np.abs(sweep)
+    slack = tol / np.maximum(radius, TOLERANCE)
+    frac = np.where(ang <= span + slack, np.minimum(ang / span, 1.0), np.nan)
+    return np.where(2 * np.pi - ang <= slack, 0.0, frac)
+
+
+def densify(points, max_len, bulge=None):
+    """
+    对点列进行加密：长度 > max_len 的线段等分，保证每小段不超过 max_len。
+    带凸度的线段沿圆弧等分，结果全部为直线段（弦）。
+    """
+    pts = as_points(points)
+    if len(pts) < 2:
+        return pts.copy()
+    a, d = pts[:-1], np.diff(pts, axis=0)
+    dist = segment_lengths(d, bulge)
+    # 每段插入 int(dist // max_len) 个等距点，即分成 steps + 1 份
+    steps = np.where(dist > max_len, dist // max_len, 0).astype(np.int64)
+    pieces = steps + 1
+    seg = np.repeat(np.arange(len(a)), pieces)
+    first = np.cumsum(pieces) - pieces
+    k = np.arange(len(seg)) - np.repeat(first, pieces)
+    t = k / pieces[seg]
+    dense = np.empty((len(seg) + 1, 2))
+    if bulge is None:
+        dense[:-1] = a[seg] + d[seg] * t[:, None]
+    else:
+        dense[:-1], _ = segment_points_tangents(a, d, _bulge(bulge, len(a)), seg, t)
+    dense[-1] = pts[-1]
+    return dense
+
+
+def calc_cum_len(points, bulge=None):
+    """计算各点到起点的累积长度数组（圆弧段取弧长），与 points 等长。"""
+    pts = as_points(points)
+    cum = np.zeros(len(pts))
+    if len(pts) > 1:
+        d = np.diff(pts, axis=0)
+        np.cumsum(segment_lengths(d, bulge), out=cum[1:])
+    return cum
+
+
+def unit(vecs):
+    """把 (K, 2) 向量归一化；长度小于容差的向量取 (1, 0)。"""
+    v = np.asarray(vecs, dtype=np.float64).reshape(-1, 2)
+    mag = np.hypot(v[:, 0], v[:, 1])
+    out = np.zeros_like(v)
+    out[:, 0] = 1.0
+    ok = mag > TOLERANCE
+    out[ok] = v[ok] / mag[ok, None]
+    return out
+
+
+def segment_tangents(points):
+    """返回每条线段的单位方向向量 (N-1, 2)，退化线段取 (1, 0)。"""
+    return unit(np.diff(as_points(points), axis=0))
+
+
+# ---------- 查询 ----------------------------------------------------
+def project_points(points, cum, xy, bulge=None):
+    """
+    把一批点 xy 投影到折线 points 上，逐点取距离最近的线段（圆弧段按圆弧求最近点）。
+    返回 (station, dist, seg)：沿线累积长度、到折线的距离、所在线段序号。
+    """
+    pts = as_points(points)
+    q = as_points(xy)
+    a, ab = pts[:-1], np.diff(pts, axis=0)
+    ab2 = np.einsum('ij,ij->i', ab, ab)
+    valid = ab2 >= TOLERANCE ** 2
+    if not valid.any():
+        n = len(q)
+        return np.full(n, np.nan), np.full(n, np.inf), np.full(n, -1)
+    idx = np.flatnonzero(valid)
+    a, ab, ab2 = a[idx], ab[idx], ab2[idx]
+    b = _bulge(bulge, len(pts) - 1)[idx]
+    arc = np.flatnonzero(np.abs(b) > ARC_EPS)
+    seg_len = segment_lengths(ab, b)
+    if len(arc):
+        center, radius, alpha, sweep = arc_geometry(a[arc], ab[arc], b[arc])
+        ends = a[arc] + ab[arc]
+
+    station = np.empty(len(q))
+    dist = np.empty(len(q))
+    seg = np.empty(len(q), dtype=np.int64)
+    step = max(1, CHUNK_SIZE // len(idx))
+    for s in range(0, len(q), step):
+        p = q[s:s + step, None, :]
+        t = np.clip(np.einsum('ijk,jk->ij', p - a, ab) / ab2, 0.0, 1.0)
+        foot = a + ab * t[..., None]
+        d = np.hypot(p[..., 0] - foot[..., 0], p[..., 1] - foot[..., 1])
+        if len(arc):
+            # 圆弧：极角落在圆弧范围内时最近点为径向投影，否则取较近的端点
+            rel = p - center
+            r = np.hypot(rel[..., 0], rel[..., 1])
+            ang = np.mod((np.arctan2(rel[..., 1], rel[..., 0]) - alpha) * np.sign(sweep), 2 * np.pi)
+            d0 = np.hypot(p[..., 0] - a[arc, 0], p[..., 1] - a[arc, 1])
+            d1 = np.hypot(p[..., 0] - ends[:, 0], p[..., 1] - ends[:, 1])
+            inside = ang <= np.abs(sweep)
+            d[:, arc] = np.where(inside, np.abs(r - radius), np.minimum(d0, d1))
+            t[:, arc] = np.where(inside, ang / np.abs(sweep), (d1 < d0).astype(np.float64))
+        best = np.argmin(d, axis=1)              # 距离相同时取序号最小的线段
+        rows = np.arange(len(best))
+        seg[s:s + step] = idx[best]
+        dist[s:s + step] = d[rows, best]
+        station[s:s + step] = cum[idx[best]] + t[rows, best] * seg_len[best]
+    return station, dist, seg
+
+
+def segment_distance(xy, starts, dirs, bulge=None):
+    """
+    逐行求点 xy 到对应线段（直线或圆弧）的最近距离，xy 与线段一一配对。
+    返回 (dist, t)：距离、最近点在线段上的长度比例（0–1）。
+    """
+    p = as_points(xy)
+    a = as_points(starts)
+    ab = as_points(dirs)
+    ab2 = np.maximum(np.einsum('ij,ij->i', ab, ab), TOLERANCE ** 2)
+    t = np.clip(np.einsum('ij,ij->i', p - a, ab) / ab2, 0.0, 1.0)
+    foot = a + ab * t[:, None]
+    dist = np.hypot(p[:, 0] - foot[:, 0], p[:, 1] - foot[:, 1])
+    b = _bulge(bulge, len(a))
+    arc = np.flatnonzero(np.abs(b) > ARC_EPS)
+    if len(arc):
+        # 与 project_points 相同：极角落在圆弧范围内时取径向投影，否则取较近的端点
+        center, radius, alpha, sweep = arc_geometry(a[arc], ab[arc], b[arc])
+        q = p[arc]
+        rel = q - center
+        ang = np.mod((np.arctan2(rel[:, 1], rel[:, 0]) - alpha) * np.sign(sweep), 2 * np.pi)
+        d0 = np.hypot(q[:, 0] - a[arc, 0], q[:, 1] - a[arc, 1])
+        end = a[arc] + ab[arc]
+        d1 = np.hypot(q[:, 0] - end[:, 0], q[:, 1] - end[:, 1])
+        inside = ang <= np.abs(sweep)
+        dist[arc] = np.where(inside, np.abs(np.hypot(rel[:, 0], rel[:, 1]) - radius), np.minimum(d0, d1))
+        t[arc] = np.where(inside, ang / np.abs(sweep), (d1 < d0).astype(np.float64))
+    return dist, t
+
+
+def calc_mileage(points, cum, xy, offset, bulge=None):
+    """批量计算点 xy 在折线上对应的里程值（累积长度 + offset）。"""
+    station, _, _ = project_points(points, cum, xy, bulge)
+    return station + offset
+
+
+def points_and_tangents(points, cum, target_lens, bulge=None):
+    """
+    批量版 point_and_tangent：对一组累积长度 target_lens 求坐标和切线单位向量。
+    查询先排序，再与 cum 做一次有序归并定位（已排序的查询让 searchsorted 逐个沿用上次位置），
+    结果按调用方原顺序返回 (pts, tangents)，均为 (K, 2) 数组。
+    bulge 给出时圆弧段按圆弧解析定位，cum 应为按弧长计算的累积长度。
+    """
+    pts = as_points(points)
+    q = np.asarray(target_lens, dtype=np.float64).ravel()
+    if len(pts) < 2:
+        return np.repeat(pts[:1], len(q), axis=0), unit(np.tile([1.0, 0.0], (len(q), 1)))
+
+    order = np.argsort(q, kind='stable')
+    qs = q[order]
+    # 第一条满足 cum[i] <= L <= cum[i+1] 的线段
+    i = np.clip(np.searchsorted(cum, qs, side='left') - 1, 0, len(pts) - 2)
+    seg_len = cum[i + 1] - cum[i]
+    ok = seg_len >= TOLERANCE
+    ratio = np.where(ok, (qs - cum[i]) / np.where(ok, seg_len, 1.0), 0.0)
+    starts, dirs = pts[:-1], np.diff(pts, axis=0)
+    pt, tan = segment_points_tangents(starts, dirs, bulge, i, ratio)
+    # 超出两端时固定在端点，切线取端部线段（圆弧取端点处）方向
+    lo, hi = qs <= cum[0], qs >= cum[-1]
+    end_tan = segment_points_tangents(starts, dirs, bulge, [0, len(dirs) - 1], [0.0, 1.0])[1]
+    pt[lo], tan[lo] = pts[0], end_tan[0]
+    pt[hi], tan[hi] = pts[-1], end_tan[1]
+
+    out_pt = np.empty_like(pt)
+    out_tan = np.empty_like(tan)
+    out_pt[order], out_tan[order] = pt, tan
+    return out_pt, out_tan
+
+
+def point_and_tangent(points, cum, target_len, bulge=None):
+    """
+    在折线 points 上找累积长度为 target_len 处的坐标和切线单位向量。
+    超出两端时固定在端点，切线取端部线段方向。返回 (pt, t)。
+    """
+    pt, tan = points_and_tangents(points, cum, [target_len], bulge)
+    return pt[0], tan[0]
+
+
+# ---------- 求交 ----------------------------------------------------
+def segments(points):
+    """把折线拆成线段集合，返回 (起点, 方向向量)，均为 (N-1, 2) 数组。"""
+    pts = as_points(points)
+    if len(pts) < 2:
+        return np.empty((0, 2)), np.empty((0, 2))
+    return pts[:-1], np.diff(pts, axis=0)
+
+
+def stack_segments(polys):
+    """
+    把多条折线的线段首尾相接合并为一个线段集合。
+    返回 (starts, dirs, owner, first)：owner 为线段所属折线序号，first[k] 为第 k 条折线首段的全局序号。
+    """
+    starts, dirs = [np.empty((0, 2))], [np.empty((0, 2))]
+    owner = [np.empty(0, dtype=np.int64)]
+    first = np.zeros(len(polys), dtype=np.int64)
+    total = 0
+    for k, pts in enumerate(polys):
+        a, d = segments(pts)
+        starts.append(a)
+        dirs.append(d)
+        owner.append(np.full(len(d), k, dtype=np.int64))
+        first[k] = total
+        total += len(d)
+    return np.concatenate(starts), np.concatenate(dirs), np.concatenate(owner), first
+
+
+def stack_bulges(bulges, polys):
+    """与 stack_segments 相同顺序拼接各折线的线段凸度；bulges 中为 None 的折线按直线处理。"""
+    parts = [np.empty(0)]
+    for b, pts in zip(bulges, polys):
+        parts.append(_bulge(b, max(len(pts) - 1, 0)))
+    return np.concatenate(parts)
+
+
+def segment_bounds(starts, dirs, bulge=None):
+    """返回每条线段的包围盒 (lo, hi)；圆弧段计入落在弧上的坐标轴极值点。"""
+    ends = starts + dirs
+    lo, hi = np.minimum(starts, ends), np.maximum(starts, ends)
+    if bulge is not None:
+        arc = np.flatnonzero(np.abs(bulge) > ARC_EPS)
+        if len(arc):
+            center, radius, alpha, sweep = arc_geometry(starts[arc], dirs[arc], bulge[arc])
+            for k in range(4):
+                phi = k * np.pi / 2
+                on = np.mod((phi - alpha) * np.sign(sweep), 2 * np.pi) <= np.abs(sweep)
+                ext = center + radius[:, None] * np.array([np.cos(phi), np.sin(phi)])
+                lo[arc[on]] = np.minimum(lo[arc[on]], ext[on])
+                hi[arc[on]] = np.maximum(hi[arc[on]], ext[on])
+    return lo, hi
+
+
+def _line_hits(p, r, q, s, i, j, tol):
+    """直线 × 直线：返回真正相交的 (xy, i, t, j, u)，保持候选对原顺序。"""
+    p, r, q, s = p[i], r[i], q[j], s[j]
+    denom = r[:, 0] * s[:, 1] - r[:, 1] * s[:, 0]
+    qp = q - p
+    ok = np.abs(denom) > 1e-12                   # 平行或共线不计交点
+    safe = np.where(ok, denom, 1.0)
+    t = (qp[:, 0] * s[:, 1] - qp[:, 1] * s[:, 0]) / safe
+    u = (qp[:, 0] * r[:, 1] - qp[:, 1] * r[:, 0]) / safe
+    # 参数容差按线段长度换算为距离容差
+    rl = np.maximum(np.hypot(r[:, 0], r[:, 1]), TOLERANCE)
+    sl = np.maximum(np.hypot(s[:, 0], s[:, 1]), TOLERANCE)
+    ok &= (t >= -tol / rl) & (t <= 1 + tol / rl) & (u >= -tol / sl) & (u <= 1 + tol / sl)
+
+    keep = np.flatnonzero(ok)
+    t = np.clip(t[keep], 0.0, 1.0)
+    u = np.clip(u[keep], 0.0, 1.0)
+    return p[keep] + r[keep] * t[:, None], i[keep], t, j[keep], u
+
+
+def _primitive(start, d, b):
+    """单条线段的图元描述：('line', 起点, 方向) 或 ('arc', 圆心, 半径, 起始角, 圆心角)。"""
+    if abs(b) <= ARC_EPS:
+        return ('line', start, d)
+    center, radius, alpha, sweep = arc_geometry(start[None], d[None], np.array([b]))
+    return ('arc', center[0], radius[0], alpha[0], sweep[0])
+
+
+def _circle_points(g1, g2, tol):
+    """两个图元所在直线/圆的交点候选（至多两个），相切时给出一个。"""
+    if g1[0] == 'line' and g2[0] == 'line':
+        return []
+    if g1[0] == 'arc' and g2[0] == 'line':
+        g1, g2 = g2, g1
+    if g1[0] == 'line':
+        p, r = g1[1], g1[2]
+        c, rad = g2[1], g2[2]
+        rr = float(r @ r)
+        if rr < TOLERANCE ** 2:
+            return []
+        foot = p + r * (float((c - p) @ r) / rr)
+        h = float(np.hypot(*(foot - c)))
+        if h > rad + tol:
+            return []
+        half = np.sqrt(max(rad * rad - h * h, 0.0))
+        if half <= tol:
+            return [foot]
+        e = r / np.sqrt(rr)
+        return [foot - e * half, foot + e * half]
+    c1, r1, c2, r2 = g1[1], g1[2], g2[1], g2[2]
+    d = float(np.hypot(*(c2 - c1)))
+    if d < 1e-12 or d > r1 + r2 + tol or d < abs(r1 - r2) - tol:
+        return []                             # 同心（含重合圆弧）或相离、内含不计交点
+    e = (c2 - c1) / d
+    a = (d * d + r1 * r1 - r2 * r2) / (2 * d)
+    h = np.sqrt(max(r1 * r1 - a * a, 0.0))
+    base = c1 + e * a
+    if h <= tol:
+        return [base]
+    n = np.array([-e[1], e[0]])
+    return [base - n * h, base + n * h]
+
+
+def _fraction(g, xy, tol):
+    """点 xy 在图元 g 上的长度比例，落在图元外（放宽 tol）时返回 None。"""
+    if g[0] == 'line':
+        p, r = g[1], g[2]
+        rr = float(r @ r)
+        t = float((xy - p) @ r) / rr
+        slack = tol / max(np.sqrt(rr), TOLERANCE)
+        return min(max(t, 0.0), 1.0) if -slack <= t <= 1 + slack else None
+    f = arc_fraction(g[1], g[2], g[3], g[4], xy, tol)[0]
+    return None if np.isnan(f) else float(f)
+
+
+def _curve_hits(p, r, bp, q, s, bq, i, j, tol):
+    """至少一方为圆弧的候选对逐对解析求交，返回 (xy, i, t, j, u)；t、u 为长度比例。"""
+    out = ([], [], [], [], [])
+    for a, b in zip(i.tolist(), j.tolist()):
+        g1 = _primitive(p[a], r[a], bp[a])
+        g2 = _primitive(q[b], s[b], bq[b])
+        for xy in _circle_points(g1, g2, tol):
+            t, u = _fraction(g1, xy, tol), _fraction(g2, xy, tol)
+            if t is None or u is None:
+                continue
+            for lst, v in zip(out, (xy, a, t, b, u)):
+                lst.append(v)
+    xy = np.asarray(out[0], dtype=np.float64).reshape(-1, 2)
+    return (xy, np.asarray(out[1], dtype=np.int64), np.asarray(out[2], dtype=np.float64),
+            np.asarray(out[3], dtype=np.int64), np.asarray(out[4], dtype=np.float64))
+
+
+def intersect_pairs(p, r, q, s, i, j, tol=TOLERANCE, bp=None, bq=None):
+    """
+    对候选线段对 (p[i] + t·r[i], q[j] + u·s[j]) 做精确求交。
+    bp、bq 为两组线段的凸度（可省略），含圆弧的线段对按直线/圆解析求交。
+    返回 (xy, i, t, j, u)，t、u 为交点在各自线段上的长度比例，
+    只保留真正相交的线段对，按 (i, j, t) 排序，不去重。
+    """
+    i = np.asarray(i, dtype=np.int64)
+    j = np.asarray(j, dtype=np.int64)
+    curved = np.zeros(len(i), dtype=bool)
+    if bp is not None:
+        curved |= np.abs(bp[i]) > ARC_EPS
+    if bq is not None:
+        curved |= np.abs(bq[j]) > ARC_EPS
+    if not curved.any():
+        xy, i, t, j, u = _line_hits(p, r, q, s, i, j, tol)
+        order = np.lexsort((j, i))
+        return xy[order], i[order], t[order], j[order], u[order]
+
+    straight = ~curved
+    parts = [_line_hits(p, r, q, s, i[straight], j[straight], tol),
+             _curve_hits(p, r, _bulge(bp, len(p)), q, s, _bulge(bq, len(q)),
+                         i[curved], j[curved], tol)]
+    xy, i, t, j, u = (np.concatenate([part[k] for part in parts]) for k in range(5))
+    order = np.lexsort((t, j, i))
+    return xy[order], i[order], t[order], j[order], u[order]
+
+
+def dedupe_hits(xy, group, tol=TOLERANCE):
+    """同一 group 内坐标相差不超过 tol 的交点只保留第一个，返回保留的下标。"""
+    keep, seen = [], {}
+    for k in range(len(xy)):
+        x, y = xy[k]
+        found = seen.setdefault(group[k], [])
+        if not any(abs(x - fx) <= tol and abs(y - fy) <= tol for fx, fy in found):
+            found.append((x, y))
+            keep.append(k)
+    return np.asarray(keep, dtype=np.int64)
+
+
+def intersect_polylines(p1, p2, tol=TOLERANCE, b1=None, b2=None):
+    """
+    计算两条折线的全部交点（不含自交），重复交点只保留第一个。
+    b1、b2 为可选的线段凸度。
+    返回 (xy, i1, t1, i2, t2)：交点坐标、两条折线上的线段序号及线段参数 [0, 1]。
+    """
+    a1 = as_points(p1)
+    a2 = as_points(p2)
+    if len(a1) < 2 or len(a2) < 2:
+        return (np.empty((0, 2)), np.empty(0, dtype=np.int64), np.empty(0),
+                np.empty(0, dtype=np.int64), np.empty(0))
+
+    s1, d1 = segments(a1)
+    s2, d2 = segments(a2)
+    b1 = None if b1 is None else _bulge(b1, len(s1))
+    b2 = None if b2 is None else _bulge(b2, len(s2))
+    lo1, hi1 = segment_bounds(s1, d1, b1)
+    lo2, hi2 = segment_bounds(s2, d2, b2)
+
+    parts_i, parts_j = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+    step = max(1, CHUNK_SIZE // len(s2))
+    for s in range(0, len(s1), step):
+        e = min(s + step, len(s1))
+        # 包围盒预筛
+        hit = ((lo1[s:e, None, 0] <= hi2[None, :, 0] + tol) &
+               (lo2[None, :, 0] <= hi1[s:e, None, 0] + tol) &
+               (lo1[s:e, None, 1] <= hi2[None, :, 1] + tol) &
+               (lo2[None, :, 1] <= hi1[s:e, None, 1] + tol))
+        i, j = np.nonzero(hit)
+        parts_i.append(i + s)
+        parts_j.append(j)
+    xy, i, t, j, u = intersect_pairs(s1, d1, s2, d2, np.concatenate(parts_i),
+                                     np.concatenate(parts_j), tol, b1, b2)
+    keep = dedupe_hits(xy, np.zeros(len(xy), dtype=np.int64), tol)
+    return xy[keep], i[keep], t[keep], j[keep], u[keep]
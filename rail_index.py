@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_index.py — 线段级空间索引
+# 1) SegmentGrid：均匀网格，把每条线段登记到其包围盒覆盖的全部网格
+# 2) 查询时只返回包围盒真正重叠的候选线段对，避免“全部 × 全部”的比较
+# 3) 建立与查询均为 NumPy 批量运算，一次处理整条折线的全部线段
+# 4) sweep_pairs：红蓝两组包围盒的扫描线配对，适合未加密的长线段
+# 5) KDTree：点集的 k-d 树，批量最近邻查询（如为每个里程位置找最近的连接目标）
+
+import numpy as np
+
+MAX_CELLS = 4096             # 网格每个方向的最大格数，防止极小线段导致格子过密
+LEAF_SIZE = 8                # k-d 树叶节点的最大点数
+
+
+def _expand(ix0, iy0, ix1, iy1, ncols):
+    """把每个对象覆盖的网格范围展开为 (对象序号, 网格编号) 对。"""
+    nx = ix1 - ix0 + 1
+    ny = iy1 - iy0 + 1
+    counts = nx * ny
+    item = np.repeat(np.arange(len(counts)), counts)
+    first = np.cumsum(counts) - counts
+    local = np.arange(len(item)) - np.repeat(first, counts)
+    cx = ix0[item] + local % nx[item]
+    cy = iy0[item] + local // nx[item]
+    return item, cy * ncols + cx
+
+
+class SegmentGrid:
+    """
+    线段包围盒的均匀网格索引。
+    lo, hi 为 (K, 2) 的包围盒下角、上角；cell 为网格边长，缺省时取线段尺寸的中位数。
+    """
+
+    def __init__(self, lo, hi, cell=None):
+        self.lo = np.asarray(lo, dtype=np.float64).reshape(-1, 2)
+        self.hi = np.asarray(hi, dtype=np.float64).reshape(-1, 2)
+        if len(self.lo):
+            self.origin = self.lo.min(axis=0)
+            extent = float((self.hi.max(axis=0) - self.origin).max())
+        else:
+            self.origin = np.zeros(2)
+            extent = 0.0
+        if cell is None:
+            size = (self.hi - self.lo).max(axis=1) if len(self.lo) else np.zeros(0)
+            cell = float(np.median(size)) if len(size) else 1.0
+        self.cell = max(cell, extent / MAX_CELLS, 1e-9)
+        self.ncols = int(extent // self.cell) + 2
+
+        ix0, iy0, ix1, iy1 = self._cells(self.lo, self.hi)
+        item, key = _expand(ix0, iy0, ix1, iy1, self.ncols)
+        order = np.argsort(key, kind='stable')
+        self.items = item[order]
+        keys = key[order]
+        # 每个非空网格在 items 中的起止位置
+        self.keys, self.starts = np.unique(keys, return_index=True)
+        self.ends = np.append(self.starts[1:], len(keys))
+
+    def __len__(self):
+        return len(self.lo)
+
+    def _cells(self, lo, hi):
+        last = self.ncols - 1
+        a = np.clip(((lo - self.origin) // self.cell).astype(np.int64), 0, last)
+        b = np.clip(((hi - self.origin) // self.cell).astype(np.int64), 0, last)
+        return a[:, 0], a[:, 1], b[:, 0], b[:, 1]
+
+    def query(self, lo, hi, tol=0.0):
+        """
+        对一批查询包围盒 (lo, hi) 返回全部候选对 (查询序号, 线段序号)，
+        结果已去重且按 (查询序号, 线段序号) 排序，只保留包围盒重叠（放宽 tol）的组合。
+        """
+        lo = np.asarray(lo, dtype=np.float64).reshape(-1, 2) - tol
+        hi = np.asarray(hi, dtype=np.float64).reshape(-1, 2) + tol
+        none = np.empty(0, dtype=np.int64)
+        if not len(self.keys) or not len(lo):
+            return none, none
+        # 整体落在网格范围外的查询直接排除
+        far = self.origin + self.cell * self.ncols
+        inside = np.flatnonzero((hi >= self.origin).all(axis=1) & (lo <= far).all(axis=1))
+        if not len(inside):
+            return none, none
+
+        ix0, iy0, ix1, iy1 = self._cells(lo[inside], hi[inside])
+        q, key = _expand(ix0, iy0, ix1, iy1, self.ncols)
+        pos = np.searchsorted(self.keys, key)
+        pos = np.minimum(pos, len(self.keys) - 1)
+        found = self.keys[pos] == key
+        q, pos = inside[q[found]], pos[found]
+
+        counts = self.ends[pos] - self.starts[pos]
+        qi = np.repeat(q, counts)
+        first = np.cumsum(counts) - counts
+        local = np.arange(len(qi)) - np.repeat(first, counts)
+        si = self.items[np.repeat(self.starts[pos], counts) + local]
+
+        pair = np.unique(qi * len(self.lo) + si)
+        qi, si = pair // len(self.lo), pair % len(self.lo)
+        ok = ((lo[qi] <= self.hi[si]) & (self.lo[si] <= hi[qi])).all(axis=1)
+        return qi[ok], si[ok]
+
+
+def sweep_pairs(lo1, hi1, lo2, hi2, tol=0.0):
+    """
+    扫描线求两组包围盒（红 1、蓝 2）之间的全部重叠对，不比较同组内部。
+    沿跨度较大的坐标轴扫描，只在“活动集”中检查另一坐标轴的区间重叠。
+    返回按 (i, j) 排序的 (红序号, 蓝序号)。
+    """
+    lo1 = np.asarray(lo1, dtype=np.float64).reshape(-1, 2) - tol
+    hi1 = np.asarray(hi1, dtype=np.float64).reshape(-1, 2) + tol
+    lo2 = np.asarray(lo2, dtype=np.float64).reshape(-1, 2)
+    hi2 = np.asarray(hi2, dtype=np.float64).reshape(-1, 2)
+    n1 = len(lo1)
+    none = np.empty(0, dtype=np.int64)
+    if not n1 or not len(lo2):
+        return none, none
+
+    lo = np.vstack([lo1, lo2])
+    hi = np.vstack([hi1, hi2])
+    span = hi.max(axis=0) - lo.min(axis=0)
+    ax = int(span[1] > span[0])
+    ay = 1 - ax
+    order = np.argsort(lo[:, ax], kind='stable').tolist()
+    start, end = lo[:, ax].tolist(), hi[:, ax].tolist()
+    ylo, yhi = lo[:, ay].tolist(), hi[:, ay].tolist()
+
+    active = [[], []]                    # 红、蓝两组当前与扫描线相交的对象
+    out_i, out_j = [], []
+    for k in order:
+        x = start[k]
+        blue = k >= n1
+        y0, y1 = ylo[k], yhi[k]
+        # 扫描另一组活动集：顺带剔除已完全位于扫描线之前的对象
+        alive = []
+        for m in active[not blue]:
+            if end[m] < x:
+                continue
+            alive.append(m)
+            if ylo[m] <= y1 and y0 <= yhi[m]:
+                if blue:
+                    out_i.append(m)
+                    out_j.append(k - n1)
+                else:
+                    out_i.append(k)
+                    out_j.append(m - n1)
+        active[not blue] = alive
+        active[blue].append(k)
+
+    i = np.asarray(out_i, dtype=np.int64)
+    j = np.asarray(out_j, dtype=np.int64)
+    order = np.lexsort((j, i))
+    return i[order], j[order]
+
+
+class KDTree:
+    """
+    二维点集的 k-d 树：每个节点沿包围盒较长的一边按中位数二分，叶节点至多 leaf_size 个点。
+    建树 O(T log T)；查询整批进行，先沿分割值下降到所在叶节点取得上界，
+    再从根逐层展开、剔除包围盒距离超过当前最近距离的节点，每个查询点约 O(log T)。
+    """
+
+    def __init__(self, points, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)[:, :2].reshape(-1, 2)
+        self.perm = np.arange(len(self.points))
+        lo, hi, axis, split, left, right, start, end = ([] for _ in range(8))
+        todo = [(0, len(self.points), -1, 0)] if len(self.points) else []   # (起, 止, 父节点, 左/右)
+        while todo:
+            a, b, parent, side = todo.pop()
+            node = len(lo)
+            if parent >= 0:
+                (left if side == 0 else right)[parent] = node
+            pts = self.points[self.perm[a:b]]
+            lo.append(pts.min(axis=0))
+            hi.append(pts.max(axis=0))
+            start.append(a)
+            end.append(b)
+            left.append(-1)
+            right.append(-1)
+            if b - a <= leaf_size:
+                axis.append(0)
+                split.append(0.0)
+                continue
+            ax = int(np.argmax(hi[-1] - lo[-1]))
+            mid = (a + b) // 2
+            sub = self.perm[a:b]
+            self.perm[a:b] = sub[np.argpartition(pts[:, ax], mid - a)]
+            axis.append(ax)
+            split.append(self.points[self.perm[mid], ax])
+            todo.append((mid, b, node, 1))
+            todo.append((a, mid, node, 0))
+        self.lo = np.array(lo).reshape(-1, 2)
+        self.hi = np.array(hi).reshape(-1, 2)
+        self.axis = np.array(axis, dtype=np.int64)
+        self.split = np.array(split, dtype=np.float64)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)
+        self.end = np.array(end, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.points)
+
+    def _visit_leaves(self, q, qi, node, idx, dist):
+        """对 (查询, 叶节点) 对逐点求距离，更新各查询的最近点（同距离取序号小者）。"""
+        counts = self.end[node] - self.start[node]
+        qi = np.repeat(qi, counts)
+        first = np.cumsum(counts) - counts
+        local = np.arange(len(qi)) - np.repeat(first, counts)
+        si = self.perm[np.repeat(self.start[node], counts) + local]
+        d = np.hypot(*(q[qi] - self.points[si]).T)
+        order = np.lexsort((si, d, qi))
+        first = order[np.r_[True, qi[order][1:] != qi[order][:-1]]]
+        rows, d, si = qi[first], d[first], si[first]
+        better = (d < dist[rows]) | ((d == dist[rows]) & ((idx[rows] < 0) | (si < idx[rows])))
+        idx[rows[better]], dist[rows[better]] = si[better], d[better]
+
+    def nearest(self, xy, max_dist=None):
+        """
+        一批点 → (最近点序号, 距离)，距离相同时取序号最小者。
+        max_dist 给出时只取该距离以内（含）的点，找不到（或点集为空）时序号为 -1、距离为 inf。
+        """
+        q = np.asarray(xy, dtype=np.float64)[:, :2].reshape(-1, 2)
+        n = len(q)
+        idx = np.full(n, -1, dtype=np.int64)
+        dist = np.full(n, np.inf if max_dist is None else float(max_dist))
+        if len(self.points) and n:
+            # 1. 沿分割值下降到所在叶节点，先得到一个最近距离上界
+            node = np.zeros(n, dtype=np.int64)
+            inner = np.flatnonzero(self.left[node] >= 0)
+            while len(inner):
+                k = node[inner]
+                below = q[inner, self.axis[k]] < self.split[k]
+                node[inner] = np.where(below, self.left[k], self.right[k])
+                inner = inner[self.left[node[inner]] >= 0]
+            self._visit_leaves(q, np.arange(n), node, idx, dist)
+
+            # 2. 从根逐层展开，只保留包围盒距离不超过当前最近距离的 (查询, 节点) 对
+            qi, node = np.arange(n), np.zeros(n, dtype=np.int64)
+            while len(qi):
+                gap = np.maximum(np.maximum(self.lo[node] - q[qi], q[qi] - self.hi[node]), 0.0)
+                keep = np.hypot(*gap.T) <= dist[qi]
+                qi, node = qi[keep], node[keep]
+                leaf = self.left[node] < 0
+                if leaf.any():
+                    self._visit_leaves(q, qi[leaf], node[leaf], idx, dist)
+                qi, node = qi[~leaf], node[~leaf]
+                qi, node = np.concatenate([qi, qi]), np.concatenate([self.left[node], self.right[node]])
+        dist[idx < 0] = np.inf
+        return idx, dist
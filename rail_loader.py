@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_loader.py — 只读计算用的流式、按图层过滤的 DXF 读取
+# 1) 借助 ezdxf.addons.iterdxf 的文件索引直接定位 ENTITIES 段，不解析 BLOCKS/OBJECTS 等段
+# 2) 先从原始记录文本中取图层名，只构造所需图层上的 LWPOLYLINE/POLYLINE（含 VERTEX）
+# 3) HATCH、TEXT 等其它实体只跳过字节，不建对象，内存随所需图层而非整张图增长
+# 4) 二进制 DXF 用 rail_binary.scan_tags 按标签位置扫描，同样只解码所需图层的折线；
+#    R12 二进制退回 ezdxf.readfile
+# 5) load_points 以同样方式读取 POINT / 图块 INSERT 的坐标，供连接线的目标点使用
+# 6) load_polylines_parallel 把 ASCII DXF 内存映射后按实体边界把 ENTITIES 段切成若干字节段，
+#    在进程池中直接解析出所需图层折线的顶点和凸度数组（PolylineData），不经过 ezdxf 实体，
+#    解析时间随 CPU 核心数缩短
+
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import ezdxf
+import numpy as np
+from ezdxf.filemanagement import dxf_file_info
+from ezdxf.addons import iterdxf
+from ezdxf.entities import factory
+from ezdxf.entities.subentity import entity_linker
+from ezdxf.lldxf.extendedtags import ExtendedTags
+
+from rail_binary import SIGNATURE, binary_version, scan_tags, tag_value, decode_tags
+
+POLY_TYPES = ('LWPOLYLINE', 'POLYLINE')
+CHUNK_SIZE = 8 << 20        # 并行解析时每个字节段的大致大小
+
+# 记录起点：组码 0 的行，下一行是实体类型名。组码行只有数字，值行后面必是组码行，
+# 所以下一行含大写字母的“0”行一定是组码行，不会把值误认为记录起点
+_RECORD = re.compile(rb'^ *0\r?\n([ 0-9]*[A-Z_][^\r\n]*)', re.M)
+# 从记录起点按“组码行 + 值行”成对跳过，取第一个组码 8（图层名）的值
+_LAYER = re.compile(rb' *0\r?\n[^\n]*\n(?:[ 0-9]+\r?\n[^\n]*\n)*? *8\r?\n([^\r\n]*)')
+
+
+def _records(dxf, start):
+    """从 index 序号 start 开始逐条读取记录，产出 (实体类型, 原始文本)，到 ENDSEC 为止。"""
+    index = dxf.structure.index
+    entry = index[start]
+    dxf.file.seek(entry.location)
+    while entry.value != 'ENDSEC':
+        start += 1
+        nxt = index[start]
+        data = dxf.file.read(nxt.location - entry.location)
+        yield entry.value, data.decode(dxf.encoding, errors=dxf.errors).replace('\r\n', '\n')
+        entry = nxt
+
+
+def _record_value(text, code, default=None):
+    """取原始记录中第一个组码为 code 的值。"""
+    lines = text.split('\n')
+    for k in range(0, len(lines) - 1, 2):
+        if lines[k].strip() == code:
+            return lines[k + 1]
+    return default
+
+
+def _layer_names(dxf):
+    """按 LAYER 表原顺序返回全部图层名。"""
+    if 'TABLES' not in dxf.sections:
+        return []
+    return [_record_value(text, '2') for kind, text in _records(dxf, dxf.sections['TABLES'] + 1)
+            if kind == 'LAYER']
+
+
+def load_polylines(dxf_path, wanted):
+    """
+    流式读取 DXF 模型空间中的折线。
+    wanted(图层名) 为真的图层才会被解析，返回 (layer_names, polys)：
+    - layer_names：LAYER 表中的全部图层名（原顺序，同 doc.layers）
+    - polys：{图层名: [实体, ...]}，每层先 LWPOLYLINE 后 POLYLINE
+    ASCII 与二进制 DXF 均可。
+    """
+    with open(dxf_path, 'rb') as f:
+        binary = f.read(len(SIGNATURE)) == SIGNATURE
+    if binary:
+        return _load_binary(dxf_path, wanted)
+    dxf = iterdxf.opendxf(str(dxf_path))
+    try:
+        layer_names = _layer_names(dxf)
+        link = entity_linker()
+        lw, pl = {}, {}
+        follow = False                   # 上一条是已接收的 POLYLINE，后续 VERTEX/SEQEND 需挂接
+        for kind, text in _records(dxf, dxf.sections['ENTITIES'] + 1):
+            if kind in POLY_TYPES:
+                follow = False
+                layer = _record_value(text, '8', '0')
+                if not wanted(layer):
+                    continue
+                entity = factory.load(ExtendedTags.from_text(text))
+                if entity.dxf.paperspace != 0:
+                    continue
+                link(entity)
+                (lw if kind == 'LWPOLYLINE' else pl).setdefault(layer, []).append(entity)
+                follow = kind == 'POLYLINE'
+            elif follow and kind in ('VERTEX', 'SEQEND'):
+                link(factory.load(ExtendedTags.from_text(text)))
+            else:
+                follow = False
+    finally:
+        dxf.close()
+
+    return layer_names, _merge(lw, pl)
+
+
+def _read_binary(dxf_path):
+    """读入二进制 DXF，返回 (数据, 版本, 编码)。"""
+    with open(dxf_path, 'rb') as f:
+        data = f.read()
+    return (data, *binary_version(data))
+
+
+def _binary_records(data, kinds):
+    """
+    逐标签扫描二进制 DXF，按出现顺序产出 TABLES / ENTITIES 段中每条记录的 (段名, 类型, 标签位置)，
+    只有 kinds 中的类型收集标签位置，其余为 None（只跳过字节）。
+    """
+    section = kind = rec = None
+    for tag in scan_tags(data):
+        code, start, stop, _ = tag
+        if code != 0:
+            if rec is not None:
+                rec.append(tag)
+            elif code == 2 and kind == b'SECTION' and section is None:
+                section = data[start:stop]
+            continue
+        if section in (b'TABLES', b'ENTITIES') and kind not in (b'SECTION', b'ENDSEC'):
+            yield section, kind, rec
+        kind = data[start:stop]
+        if kind == b'SECTION':
+            section = None
+        elif kind == b'EOF':
+            return
+        rec = [tag] if section in (b'TABLES', b'ENTITIES') and kind in kinds else None
+
+
+def _load_binary(dxf_path, wanted):
+    """load_polylines 的二进制 DXF 版本：逐标签扫描，只解码 LAYER 表项和所需图层的折线。"""
+    data, version, encoding = _read_binary(dxf_path)
+    if version <= 'AC1009':
+        doc = ezdxf.readfile(dxf_path)
+        return [layer.dxf.name for layer in doc.layers], group_polylines(doc.modelspace(), wanted)
+
+    def value(rec, code, default):
+        return next((tag_value(data, *p[:3], encoding) for p in rec if p[0] == code), default)
+
+    poly_types = {name.encode('ascii') for name in POLY_TYPES}
+    layer_names = []
+    link = entity_linker()
+    lw, pl = {}, {}
+    follow = False                       # 上一条是已接收的 POLYLINE，后续 VERTEX/SEQEND 需挂接
+    for section, kind, rec in _binary_records(data, poly_types | {b'LAYER', b'VERTEX', b'SEQEND'}):
+        if section == b'TABLES':
+            if kind == b'LAYER':
+                layer_names.append(value(rec, 2, ''))
+        elif kind in poly_types:
+            follow = False
+            layer = value(rec, 8, '0')
+            if not wanted(layer):
+                continue
+            entity = factory.load(ExtendedTags(decode_tags(data, rec, encoding)))
+            if entity.dxf.paperspace != 0:
+                continue
+            link(entity)
+            (lw if kind == b'LWPOLYLINE' else pl).setdefault(layer, []).append(entity)
+            follow = kind == b'POLYLINE'
+        elif follow and kind in (b'VERTEX', b'SEQEND'):
+            link(factory.load(ExtendedTags(decode_tags(data, rec, encoding))))
+        else:
+            follow = False
+    return layer_names, _merge(lw, pl)
+
+
+def load_points(dxf_path, wanted):
+    """
+    流式读取模型空间中的点位：POINT 取位置，INSERT（图块）取插入点。
+    返回 {图层名: (K, 3) 数组}，只收集 wanted(图层名) 为真的图层，按文件中的顺序排列。
+    ASCII 与二进制 DXF 均可。
+    """
+    points = {}
+    with open(dxf_path, 'rb') as f:
+        binary = f.read(len(SIGNATURE)) == SIGNATURE
+    if binary:
+        data, version, encoding = _read_binary(dxf_path)
+        if version <= 'AC1009':
+            for e in ezdxf.readfile(dxf_path).modelspace().query('POINT INSERT'):
+                if wanted(e.dxf.layer):
+                    xyz = e.dxf.location if e.dxftype() == 'POINT' else e.dxf.insert
+                    points.setdefault(e.dxf.layer, []).append(tuple(xyz))
+        else:
+            for _, kind, rec in _binary_records(data, {b'POINT', b'INSERT'}):
+                if rec is None:
+                    continue
+                tags = {}
+                for p in rec[1:]:
+                    if p[0] in (8, 10, 20, 30, 67) and p[0] not in tags:
+                        tags[p[0]] = tag_value(data, *p[:3], encoding)
+                layer = tags.get(8, '0')
+                if tags.get(67, 0) == 0 and wanted(layer):
+                    points.setdefault(layer, []).append((tags.get(10, 0.0), tags.get(20, 0.0), tags.get(30, 0.0)))
+    else:
+        dxf = iterdxf.opendxf(str(dxf_path))
+        try:
+            for kind, text in _records(dxf, dxf.sections['ENTITIES'] + 1):
+                if kind not in ('POINT', 'INSERT'):
+                    continue
+                layer = _record_value(text, '8', '0')
+                if _record_value(text, '67', '0').strip() == '0' and wanted(layer):
+                    points.setdefault(layer, []).append(
+                        tuple(float(_record_value(text, code, '0')) for code in ('10', '20', '30')))
+        finally:
+            dxf.close()
+    return {layer: np.array(xyz, dtype=np.float64).reshape(-1, 3) for layer, xyz in points.items()}
+
+
+class PolylineData:
+    """
+    load_polylines_parallel 解析出的一条折线：类型、图层、句柄及顶点 xy (N, 2) 和各顶点凸度 bulge (N,)。
+    代替 ezdxf 实体交给 rail_geom.poly2d / poly_bulge，dxf 属性指向自身，ent.dxf.handle 照常可用。
+    """
+    __slots__ = ('kind', 'layer', 'handle', 'xy', 'bulge')
+
+    def __init__(self, kind, layer, handle, xy, bulge):
+        self.kind = kind
+        self.layer = layer
+        self.handle = handle
+        self.xy = xy
+        self.bulge = bulge
+
+    @property
+    def dxf(self):
+        return self
+
+    def dxftype(self):
+        return self.kind
+
+
+def _find_line(data, text, pos, before):
+    """
+    从 pos 起找内容为 text 的行，且其前面几行与正则 before 相符；返回 (行首, 下一行行首)，找不到时为 None。
+    用 bytes.find 定位候选行再核对，不必对整个文件做逐行的正则匹配。
+    """
+    while True:
+        k = data.find(b'\n' + text, pos)
+        if k < 0:
+            return None
+        stop = data.find(b'\n', k + 1)
+        stop = len(data) if stop < 0 else stop + 1
+        if data[k + 1:stop].strip() == text and before.search(data[max(k - 64, 0):k + 1]):
+            return k + 1, stop
+        pos = k + 1
+
+
+_SECTION_HEAD = re.compile(rb'(?:^|\n) *0\r?\nSECTION *\r?\n *2\r?\n$')
+_ENDSEC_HEAD = re.compile(rb'(?:^|\n) *0\r?\n$')
+
+
+def _section_span(data, name):
+    """ASCII DXF 中某个段（不含 SECTION / ENDSEC 记录）的字节范围，没有该段时为 None。"""
+    head = _find_line(data, name, 0, _SECTION_HEAD)
+    if head is None:
+        return None
+    end = _find_line(data, b'ENDSEC', head[1] - 1, _ENDSEC_HEAD)
+    if end is None:
+        return head[1], len(data)
+    return head[1], data.rfind(b'\n', 0, end[0] - 1) + 1
+
+
+def _iter_records(data):
+    """逐条产出 data（由完整记录组成）中记录的 (类型名, 起点, 终点)。"""
+    found = [(m.group(1).strip(), m.start()) for m in _RECORD.finditer(data)]
+    for k, (kind, start) in enumerate(found):
+        yield kind, start, found[k + 1][1] if k + 1 < len(found) else len(data)
+
+
+def _split_points(data, start, stop, size):
+    """
+    把 [start, stop) 按约 size 字节切开，切点都落在记录起点上，
+    且不落在 POLYLINE 与其 VERTEX / SEQEND 之间。返回切点列表（含两端）。
+    """
+    cuts = [start]
+    pos = start + size
+    while pos < stop:
+        m = _RECORD.search(data, pos, stop)
+        while m is not None and m.group(1).strip() in (b'VERTEX', b'SEQEND'):
+            m = _RECORD.search(data, m.end(), stop)
+        if m is None:
+            break
+        cuts.append(m.start())
+        pos = m.start() + size
+    cuts.append(stop)
+    return cuts
+
+
+def _tags(record):
+    """一条记录的 (组码数组, 值列表)。"""
+    lines = record.splitlines()
+    return np.array(lines[0::2]).astype(np.int64), lines[1::2]
+
+
+def _first(codes, values, code, default=None):
+    k = np.flatnonzero(codes == code)
+    return values[k[0]] if len(k) else default
+
+
+def _parse_entities(data, encoding, wanted, known):
+    """
+    解析一段 ENTITIES 字节（由若干完整记录组成），按出现顺序返回模型空间中
+    图层在 wanted 里或不在 known 里（LAYER 表中没有的图层）的折线 [PolylineData, ...]。
+    """
+    out = []
+    poly = None                          # 已接收的 POLYLINE，收集后续 VERTEX 直到 SEQEND
+
+    def close():
+        pts, bulge, entity = poly
+        entity.xy = np.array(pts, dtype=np.float64).reshape(-1, 2)
+        entity.bulge = np.array(bulge, dtype=np.float64)
+        out.append(entity)
+
+    for kind, a, b in _iter_records(data):
+        if kind == b'VERTEX' and poly is not None:
+            codes, values = _tags(data[a:b])
+            poly[0].append((float(_first(codes, values, 10, 0)), float(_first(codes, values, 20, 0))))
+            poly[1].append(float(_first(codes, values, 42, 0)))
+            continue
+        if poly is not None:             # SEQEND 或其它记录结束 POLYLINE 序列
+            close()
+            poly = None
+        if kind not in (b'LWPOLYLINE', b'POLYLINE'):
+            continue
+        m = _LAYER.match(data, a, b)
+        layer = m.group(1).decode(encoding, errors='surrogateescape') if m else '0'
+        if layer not in wanted and layer in known:
+            continue
+        codes, values = _tags(data[a:b])
+        if int(_first(codes, values, 67, 0)) != 0:
+            continue
+        handle = _first(codes, values, 5)
+        handle = None if handle is None else handle.strip().decode('ascii', errors='replace')
+        if kind == b'POLYLINE':
+            poly = ([], [], PolylineData('POLYLINE', layer, handle, None, None))
+            continue
+        values = np.array(values, dtype=bytes)
+        is_x = codes == 10
+        xy = np.column_stack((values[is_x].astype(np.float64), values[codes == 20].astype(np.float64)))
+        bulge = np.zeros(len(xy))
+        at = codes == 42                 # 凸度属于它前面最近的顶点
+        bulge[(np.cumsum(is_x) - 1)[at]] = values[at].astype(np.float64)
+        out.append(PolylineData('LWPOLYLINE', layer, handle, xy, bulge))
+    if poly is not None:
+        close()
+    return out
+
+
+def _parse_range(path, start, stop, encoding, wanted, known):
+    """进程池任务：内存映射 path，解析 [start, stop) 字节段。"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return _parse_entities(data[start:stop], encoding, wanted, known)
+
+
+def load_polylines_parallel(dxf_path, wanted, workers=None):
+    """
+    load_polylines 的并行版本，返回格式相同，折线为 PolylineData（顶点与凸度数组）。
+    ASCII DXF 内存映射后找出 ENTITIES 段，在实体边界（组码 0）处切为约 CHUNK_SIZE 的字节段，
+    由 workers 个进程（缺省全部 CPU 核心）解析所需图层的 LWPOLYLINE / POLYLINE。
+    二进制 DXF 退回 load_polylines（标签扫描本身已很快）。
+    """
+    with open(dxf_path, 'rb') as f:
+        binary = f.read(len(SIGNATURE)) == SIGNATURE
+    if binary:
+        return load_polylines(dxf_path, wanted)
+    info = dxf_file_info(dxf_path)
+    encoding = 'utf8' if info.version >= 'AC1021' else info.encoding
+    workers = workers or os.cpu_count() or 1
+
+    with open(dxf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        layer_names = []
+        tables = _section_span(data, b'TABLES')
+        if tables is not None:
+            table_data = data[tables[0]:tables[1]]
+            for kind, a, b in _iter_records(table_data):
+                if kind == b'LAYER':
+                    codes, values = _tags(table_data[a:b])
+                    layer_names.append(_first(codes, values, 2, b'').decode(encoding, errors='surrogateescape'))
+        span = _section_span(data, b'ENTITIES')
+        if span is None:
+            return layer_names, {}
+        cuts = _split_points(data, *span, max(CHUNK_SIZE, (span[1] - span[0]) // (4 * workers) + 1))
+
+    known = set(layer_names)
+    chosen = {name for name in known if wanted(name)}
+    jobs = list(zip(cuts[:-1], cuts[1:]))
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            parts = list(pool.map(_parse_range, *zip(*[(str(dxf_path), a, b, encoding, chosen, known)
+                                                       for a, b in jobs])))
+    else:
+        parts = [_parse_range(str(dxf_path), a, b, encoding, chosen, known) for a, b in jobs]
+
+    lw, pl = {}, {}
+    for part in parts:
+        for poly in part:
+            if poly.layer in chosen or (poly.layer not in known and wanted(poly.layer)):
+                (lw if poly.kind == 'LWPOLYLINE' else pl).setdefault(poly.layer, []).append(poly)
+    return layer_names, _merge(lw, pl)
+
+
+def _merge(lw, pl):
+    """每个图层先 LWPOLYLINE 后 POLYLINE，与逐图层 msp.query 两次查询的拼接顺序一致。"""
+    polys = {}
+    for layer in list(lw) + [name for name in pl if name not in lw]:
+        polys[layer] = lw.get(layer, []) + pl.get(layer, [])
+    return polys
+
+
+def group_polylines(msp, wanted=None):
+    """
+    遍历一次已载入的模型空间，按图层名和类型归组折线，代替逐图层的 msp.query。
+    wanted 为 None 时收集全部图层，返回格式同 load_polylines 的 polys。
+    """
+    lw, pl = {}, {}
+    for entity in msp:
+        kind = entity.dxftype()
+        if kind not in POLY_TYPES:
+            continue
+        layer = entity.dxf.layer
+        if wanted is not None and not wanted(layer):
+            continue
+        (lw if kind == 'LWPOLYLINE' else pl).setdefault(layer, []).append(entity)
+    return _merge(lw, pl)
+
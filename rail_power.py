@@ -1,14 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-# rail_power_dynamic.py — 计算铁路-电力交叉的里程和右侧夹角（支持“电力”前缀图层）
-# 1) 从所有以“电力”开头的图层提取电力折线
-# 2) 对铁路折线和电力折线做“加密”处理，确保点位稠密
+# rail_power_dynamic.py — 计算铁路与电力线（及道路、河流、管线等）交叉的里程和右侧夹角
+# 1) 按 CROSS_RULES 的“图层前缀 → 类别”规则提取各类交叉折线（缺省只有“电力”），
+#    铁路几何与索引只准备一次，全部类别的折线一并求交
+# 2) 直接在原始直线/圆弧图元上求交（扫描线或网格索引筛选候选线段对），无需加密
 # 3) 计算交点处公里里程并排序，右侧夹角以度°分′（分精确到整数）表示
-# 4) 在表格中只输出 Mileage_m、Angle、Remark 三列
+# 4) 表格输出 Mileage_m、Angle、Remark 及类别 Category 四列，前三列含义对各类别相同
+# 5) iter_crossings 逐条铁路分段生成交叉记录，ordered=True 时按需打开分段做 k 路归并，
+#    按里程顺序输出而不必先收集全部结果；compute 直接把该流写入表格
+# 6) annotate_crossings 一体化流程：求交后在同一进程中用同一份铁路分段直接绘制标注，
+#    夹角以全精度浮点数传给 rail_power_draw，结果表只是可选的附带输出
 
-import ezdxf, math, pandas as pd
+import argparse, os, ezdxf, math, hashlib, heapq, json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from ezdxf.math import Vec2, intersect_polylines_2d
+import numpy as np
+from rail_geom import (poly2d, poly_bulge, stack_segments, stack_bulges, segment_bounds,
+                       segment_lengths, segment_points_tangents, intersect_pairs, dedupe_hits)
+from rail_index import SegmentGrid, sweep_pairs
+from rail_loader import load_polylines, load_polylines_parallel, group_polylines
+from rail_cache import file_digest, cached_rails, prepare_rails
+from rail_binary import sidecar
+from rail_alignment import Alignment
+import rail_profile
+import rail_power_draw
+from rail_table import WRITE_FORMATS, write_table
 
 # ---------- 配置区 --------------------------------------------------
 RAIL_LAYERS = {
@@ -20,90 +36,35 @@ RAIL_LAYERS = {
     'dl6': 163300,
 }
 DXF_FILE    = r'break.dxf'    # <- 修改为你的 DXF 文件完整路径
-MAX_SEG_LEN = 5.0            # 加密阈值：若相邻点间距 > 此值(m)，插值
 TOLERANCE   = 1e-6           # 几何容差
+CROSS_ENGINE = 'sweep'       # 候选线段对筛选方式：'sweep' 扫描线 / 'grid' 网格索引
+READ_MODE   = 'stream'       # 读取方式：'stream' 只流式解析所需图层 / 'full' 完整载入整张图 /
+                             # 'parallel' 内存映射后按实体边界分段、用全部 CPU 核心并行解析（数百 MB 的 ASCII 图纸）
+USE_CACHE   = True           # 是否使用铁路折线的磁盘缓存（见 rail_cache.py）
+BINARY_SIDECAR = False       # 改读底图的二进制副本（按内容哈希缓存，见 rail_binary.py），图纸不变时读取更快
+WORKERS     = 1              # 并行进程数：1 为串行，0 为使用全部 CPU 核心
+INCREMENTAL = False          # 增量模式：只重算相对上次运行新增或改动的折线所涉及的交叉
+STATE_VERSION = 5            # 增量状态文件格式版本
+OUTPUT_FORMAT = 'xlsx'       # 结果表格式：'xlsx' / 'csv' / 'parquet' / 'feather'（见 rail_table.py）
+COLUMNS     = ['Mileage_m', 'Angle', 'Remark', 'Category']
+# 交叉类别规则：图层名以前缀开头即归入该类别，按书写顺序取第一条匹配的规则
+CROSS_RULES = {
+    '电力': '电力',
+    # '道路': '道路',
+    # '河流': '河流',
+    # '管道': '管线',
+}
 
 # ---------- 工具函数 ------------------------------------------------
-def poly2d(entity):
-    """把 LWPOLYLINE/POLYLINE 投影到 Vec2 列表。"""
-    if entity.dxftype() not in ('LWPOLYLINE', 'POLYLINE'):
-        raise TypeError(f'Unsupported entity type: {entity.dxftype()}')
-    return [Vec2(pt[:2]) for pt in entity.get_points()]
-
-def densify(points, max_len=MAX_SEG_LEN):
-    """对点列进行加密：将每段 > max_len 分割为等距小段。"""
-    dense = []
-    for i in range(len(points)-1):
-        a, b = points[i], points[i+1]
-        dense.append(a)
-        dist = a.distance(b)
-        if dist > max_len:
-            steps = int(dist // max_len)
-            for k in range(1, steps):
-                t = k / steps
-                dense.append(a + (b - a) * t)
-    dense.append(points[-1])
-    return dense
-
-def segment_direction(vecs, point):
-    """返回交点 point 在线段序列 vecs 上的方向向量（单位向量）。"""
-    for i in range(len(vecs)-1):
-        a, b = vecs[i], vecs[i+1]
-        cross = (a.x - point.x)*(b.y - point.y) - (a.y - point.y)*(b.x - point.x)
-        if abs(cross) < TOLERANCE:
-            ab = b - a
-            proj = (point - a).dot(ab) / (ab.magnitude**2)
-            if 0 <= proj <= 1 and ab.magnitude > TOLERANCE:
-                return ab.normalize()
-    # fallback：找最近顶点并取相邻线段方向
-    idx = min(range(len(vecs)), key=lambda j: point.distance(vecs[j]))
-    if idx < len(vecs)-1:
-        v = vecs[idx+1] - vecs[idx]
-    else:
-        v = vecs[idx] - vecs[idx-1]
-    return v.normalize() if v.magnitude > TOLERANCE else Vec2(1, 0)
-
-def calc_cum_len(vecs):
-    """计算各点到起点的累积长度列表。"""
-    cum = [0.0]
-    for i in range(len(vecs)-1):
-        cum.append(cum[-1] + vecs[i].distance(vecs[i+1]))
-    return cum
-
-def calc_mileage(vecs, cum, point, offset):
-    """
-    计算交点 point 在线段序列 vecs 上对应的里程值（累积长度 + offset）。
-    返回 None 或 具体里程（float）。
-    """
-    best_len, best_dist = None, float('inf')
-    for i in range(len(vecs)-1):
-        a, b = vecs[i], vecs[i+1]
-        ab = b - a
-        if ab.magnitude < TOLERANCE:
-            continue
-        proj = (point - a).dot(ab) / (ab.magnitude**2)
-        if proj < 0:
-            proj_pt = a
-        elif proj > 1:
-            proj_pt = b
-        else:
-            proj_pt = a + ab * proj
-        dist = point.distance(proj_pt)
-        if dist < best_dist:
-            best_dist = dist
-            best_len = cum[i] + (proj_pt - a).magnitude
-    return None if best_len is None else best_len + offset
-
-def angle_right(t_rail: Vec2, t_pwr: Vec2):
-    """
-    计算“右侧夹角”：以铁路方向向量 t_rail 为参考，
-    将电力方向 t_pwr 相对于它的右侧夹角输出为“度°分′”格式，
-    其中“分”四舍五入到整数。如出现 60' 则进位到下一度。
-    """
-    det = t_rail.x * t_pwr.y - t_rail.y * t_pwr.x
-    dot = t_rail.x * t_pwr.x + t_rail.y * t_pwr.y
+def right_angle(t_rail, t_pwr):
+    """以铁路方向向量 t_rail 为参考，电力方向 t_pwr 的右侧夹角（度，全精度浮点数）。"""
+    det = t_rail[0] * t_pwr[1] - t_rail[1] * t_pwr[0]
+    dot = t_rail[0] * t_pwr[0] + t_rail[1] * t_pwr[1]
     theta = math.degrees(-math.atan2(det, dot))
-    ang = abs(theta) if theta >= 0 else 180 - abs(theta)
+    return abs(theta) if theta >= 0 else 180 - abs(theta)
+
+def format_angle(ang):
+    """把角度（度）格式化为“度°分′”，“分”四舍五入到整数，出现 60' 时进位到下一度。"""
     deg = int(ang)
     mins = int(round((ang - deg) * 60))
     if mins == 60:
@@ -111,68 +72,519 @@ def angle_right(t_rail: Vec2, t_pwr: Vec2):
         mins = 0
     return f"{deg}°{mins}'"
 
+def angle_right(t_rail, t_pwr):
+    """
+    计算“右侧夹角”：以铁路方向向量 t_rail 为参考，
+    将电力方向 t_pwr 相对于它的右侧夹角输出为“度°分′”格式，
+    其中“分”四舍五入到整数。如出现 60' 则进位到下一度。
+    """
+    return format_angle(right_angle(t_rail, t_pwr))
+
+def candidate_pairs(rail_start, rail_dir, pwr_start, pwr_dir, engine=CROSS_ENGINE,
+                    rail_bulge=None, pwr_bulge=None):
+    """返回包围盒重叠的候选线段对 (铁路线段序号, 电力线段序号)，圆弧段用圆弧的包围盒。"""
+    rail_lo, rail_hi = segment_bounds(rail_start, rail_dir, rail_bulge)
+    pwr_lo, pwr_hi = segment_bounds(pwr_start, pwr_dir, pwr_bulge)
+    if engine == 'grid':
+        return SegmentGrid(pwr_lo, pwr_hi).query(rail_lo, rail_hi, TOLERANCE)
+    return sweep_pairs(rail_lo, rail_hi, pwr_lo, pwr_hi, TOLERANCE)
+
+def cross_segments(rail_start, rail_dir, pwr_start, pwr_dir, engine=CROSS_ENGINE,
+                   rail_bulge=None, pwr_bulge=None):
+    """
+    只对包围盒重叠的 (铁路线段, 电力线段) 求交，
+    返回 (xy, i_rail, t_rail, i_pwr, t_pwr)，序号相对于传入的线段数组，t 为线段上的长度比例。
+    """
+    qi, si = candidate_pairs(rail_start, rail_dir, pwr_start, pwr_dir, engine,
+                             rail_bulge, pwr_bulge)
+    rail_profile.count('segment_pairs_tested', len(qi))
+    return intersect_pairs(rail_start, rail_dir, pwr_start, pwr_dir, qi, si, TOLERANCE,
+                           rail_bulge, pwr_bulge)
+
+# ---------- 并行 ----------------------------------------------------
+_shared = {}   # 子进程内共享的线段数组，由 _init_worker 一次性传入
+
+def _init_worker(arrays):
+    _shared.update(arrays)
+
+def _cross_unit(r0, r1, p0, p1):
+    """
+    进程池任务：铁路线段 [r0, r1) 与电力线段 [p0, p1) 求交，序号换算为全局序号。
+    另返回候选线段对数，由主进程计数。
+    """
+    g = _shared
+    rail_start, rail_dir, rail_bulge = (g[k][r0:r1] for k in ('rail_start', 'rail_dir', 'rail_bulge'))
+    pwr_start, pwr_dir, pwr_bulge = (g[k][p0:p1] for k in ('pwr_start', 'pwr_dir', 'pwr_bulge'))
+    qi, si = candidate_pairs(rail_start, rail_dir, pwr_start, pwr_dir, g['engine'],
+                             rail_bulge, pwr_bulge)
+    xy, i_rail, t_rail, i_pwr, t_pwr = intersect_pairs(rail_start, rail_dir, pwr_start, pwr_dir,
+                                                       qi, si, TOLERANCE, rail_bulge, pwr_bulge)
+    return xy, i_rail + r0, t_rail, i_pwr + p0, t_pwr, len(qi)
+
+def cross_parallel(rail_start, rail_dir, rail_bulge, rail_first,
+                   pwr_start, pwr_dir, pwr_bulge, pwr_first, workers):
+    """
+    按 (铁路折线, 电力折线批次) 拆分任务并行求交。
+    结果按任务顺序拼接，后续统一排序，因此与串行结果逐字节一致。
+    """
+    # 电力折线按线段数大致均分为 workers 批，批次边界落在折线之间
+    rail_bounds = np.append(rail_first, len(rail_start))
+    pwr_bounds = np.append(pwr_first, len(pwr_start))
+    cuts = np.searchsorted(pwr_bounds, np.linspace(0, len(pwr_start), workers + 1))
+    pwr_batches = sorted({(int(pwr_bounds[a]), int(pwr_bounds[b]))
+                          for a, b in zip(cuts[:-1], cuts[1:]) if pwr_bounds[a] < pwr_bounds[b]})
+    units = [(int(rail_bounds[k]), int(rail_bounds[k + 1]), p0, p1)
+             for k in range(len(rail_first)) if rail_bounds[k] < rail_bounds[k + 1]
+             for p0, p1 in pwr_batches]
+
+    arrays = {'rail_start': rail_start, 'rail_dir': rail_dir, 'rail_bulge': rail_bulge,
+              'pwr_start': pwr_start, 'pwr_dir': pwr_dir, 'pwr_bulge': pwr_bulge,
+              'engine': CROSS_ENGINE}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(arrays,)) as pool:
+        parts = list(pool.map(_cross_unit, *zip(*units))) if units else []
+    rail_profile.count('segment_pairs_tested', sum(p[5] for p in parts))
+    if not parts:
+        return (np.empty((0, 2)), np.empty(0, dtype=np.int64), np.empty(0),
+                np.empty(0, dtype=np.int64), np.empty(0))
+    return tuple(np.concatenate([p[k] for p in parts]) for k in range(5))
+
 # ---------- 主流程 --------------------------------------------------
-def compute(dxf_path: Path):
-    doc = ezdxf.readfile(dxf_path)
-    msp = doc.modelspace()
+def layer_category(name, rules):
+    """按规则（前缀 → 类别）求图层的交叉类别，不匹配任何规则时返回 None。"""
+    for prefix, category in rules.items():
+        if name.startswith(prefix):
+            return category
+    return None
+
+def load_inputs(dxf_path, rail_layers, rules, binary=None, doc=None, source=None, digest=None):
+    """
+    读取铁路分段与各类交叉折线（binary 缺省取 BINARY_SIDECAR，为真时读底图的二进制副本；
+    给出已载入的 doc 时直接从中提取，不再读文件；调用方已解析出读取源 source 或算过内容哈希 digest 时
+    直接沿用，不再重复哈希底图），返回 (rail_polys, pwr_polys)：
+    rail_polys 为 [(key, layer, pts, cum_len, offset, bulge)]，
+    pwr_polys 为 [(key, layer, pts, remark, bulge, category)]；没有任何匹配 rules 的图层时返回 None。
+    """
+    # 铁路折线优先取缓存，全部命中时只需读取各类交叉图层
+    with rail_profile.stage('cache_lookup'):
+        if digest is None and USE_CACHE:
+            digest = file_digest(dxf_path)
+        rails = cached_rails(digest, rail_layers, None)
+    missing = [layer for layer in rail_layers if layer not in rails]
+
+    def wanted(name):
+        return name in missing or layer_category(name, rules) is not None
 
-    # 动态获取所有以“电力”开头的图层名称
-    all_layers = [layer.dxf.name for layer in doc.layers]
-    pwr_layer_names = [name for name in all_layers if name.startswith("电力")]
+    if doc is None and source is None:
+        source = sidecar(dxf_path, digest) if (BINARY_SIDECAR if binary is None else binary) else dxf_path
+    with rail_profile.stage('read_dxf'):
+        if doc is None and READ_MODE == 'stream':
+            all_layers, layer_polys = load_polylines(source, wanted)
+        elif doc is None and READ_MODE == 'parallel':
+            all_layers, layer_polys = load_polylines_parallel(source, wanted)
+        else:
+            if doc is None:
+                doc = ezdxf.readfile(source)
+            all_layers = [layer.dxf.name for layer in doc.layers]
+            layer_polys = group_polylines(doc.modelspace(), wanted)
+    rails.update(prepare_rails(layer_polys, missing, rail_layers, None, digest))
+
+    # 动态获取所有匹配规则的图层名称及其类别
+    pwr_layer_names = {}
+    for name in all_layers:
+        category = layer_category(name, rules)
+        if category is not None:
+            pwr_layer_names[name] = category
 
     if not pwr_layer_names:
-        print("未发现任何以“电力”开头的图层，终止计算。")
+        print(f"未发现任何以“{'”“'.join(rules)}”开头的图层，终止计算。")
         return
 
-    # 从各电力图层提取折线并加密，同时提取 remark
-    pwr_polys = []
-    for pl_name in pwr_layer_names:
-        ents1 = list(msp.query(f'LWPOLYLINE[layer=="{pl_name}"]'))
-        ents2 = list(msp.query(f'POLYLINE[layer=="{pl_name}"]'))
-        for ent in (ents1 + ents2):
-            pts = densify(poly2d(ent))
+    # 从各类交叉图层提取折线（原始顶点及凸度），同时提取 remark；电力以外的类别与电力同样处理
+    pwr_polys = []    # (key, layer, pts, remark, bulge, category)
+    for pl_name, category in pwr_layer_names.items():
+        for ent in layer_polys.get(pl_name, []):
             parts = pl_name.split('--')
             remark = '--'.join(parts[1:-1]) if len(parts) >= 3 else ''
-            pwr_polys.append((pts, remark))
-
-    rows = []
+            pwr_polys.append((_entity_key(ent.dxf.handle, pl_name, len(pwr_polys)),
+                              pl_name, poly2d(ent), remark, poly_bulge(ent), category))
 
-    # 遍历每段铁路图层
-    for layer, offset in RAIL_LAYERS.items():
-        rails = list(msp.query(f'LWPOLYLINE[layer=="{layer}"]')) + \
-                list(msp.query(f'POLYLINE[layer=="{layer}"]'))
-        if not rails:
+    # 各铁路图层折线
+    rail_polys = []   # (key, layer, pts, cum_len, offset, bulge)
+    for layer, offset in rail_layers.items():
+        if not rails[layer]:
             print(f"Warning: layer {layer} 未找到，跳过。")
             continue
-        for rail_ent in rails:
-            rail_pts = densify(poly2d(rail_ent))
-            cum_len = calc_cum_len(rail_pts)
-            for pwr_pts, remark_text in pwr_polys:
-                intersections = intersect_polylines_2d(rail_pts, pwr_pts)
-                for ip in intersections:
-                    t_rail = segment_direction(rail_pts, ip)
-                    t_pwr  = segment_direction(pwr_pts, ip)
-                    angle_str = angle_right(t_rail, t_pwr)
-                    mileage  = calc_mileage(rail_pts, cum_len, ip, offset)
-
-                    rows.append({
-                        'Mileage_m': round(mileage, 3) if mileage is not None else None,
-                        'Angle': angle_str,
-                        'Remark': remark_text
-                    })
+        for handle, pts, cum_len, bulge in rails[layer]:
+            rail_polys.append((_entity_key(handle, layer, len(rail_polys)),
+                               layer, pts, cum_len, offset, bulge))
+    return rail_polys, pwr_polys
+
+def _workers(workers):
+    workers = WORKERS if workers is None else workers
+    return workers or os.cpu_count() or 1
+
+@rail_profile.timed('find_crossings')
+def find_crossings(dxf_path: Path, rail_layers=None, workers=None, incremental=None, rules=None,
+                   binary=None):
+    """
+    计算 dxf_path 中铁路与各类交叉折线的全部交点，返回按里程排序的行列表
+    [{'Mileage_m', 'Angle', 'Remark', 'Category', 'Angle_deg'}, ...]（Angle_deg 为全精度的
+    右侧夹角，不写入结果表）；没有任何匹配 rules（缺省 CROSS_RULES）
+    的图层时返回 None。
+    incremental 为真时借助上次运行的状态文件 <输入>.rail_power_state.json 只重算改动部分；
+    binary 为真时读底图的二进制副本（缺省 BINARY_SIDECAR）。
+    """
+    rail_layers = RAIL_LAYERS if rail_layers is None else rail_layers
+    rules = CROSS_RULES if rules is None else rules
+    workers = _workers(workers)
+    incremental = INCREMENTAL if incremental is None else incremental
+
+    inputs = load_inputs(dxf_path, rail_layers, rules, binary)
+    if inputs is None:
+        return
+    return _sorted_rows(dxf_path, inputs, rail_layers, workers, incremental)
+
+def _sorted_rows(dxf_path, inputs, rail_layers, workers, incremental):
+    rail_polys, pwr_polys = inputs
+    if incremental:
+        pairs = incremental_pairs(dxf_path.with_suffix('.rail_power_state.json'),
+                                  rail_polys, pwr_polys, rail_layers, workers)
+    else:
+        pairs = cross_rows(rail_polys, pwr_polys, workers)
+    rows = [row for key in sorted(pairs) for row in pairs[key]]
 
     # 按里程升序排序，None 里程放到末尾
     rows.sort(key=lambda x: x['Mileage_m'] if x['Mileage_m'] is not None else float('inf'))
+    return rows
+
+@rail_profile.timed('cross_rows')
+def cross_rows(rail_polys, pwr_polys, workers=1):
+    """
+    rail_polys 与 pwr_polys 两两求交，返回 {(铁路折线序号, 电力折线序号): [行, ...]}，
+    只含有交点的组合，组内按 (铁路线段, 电力线段) 顺序。
+    """
+    # 全部线段合并：owner 记录线段所属折线，first 为各折线首段的全局序号
+    pwr_start, pwr_dir, pwr_owner, pwr_first = stack_segments([p[2] for p in pwr_polys])
+    rail_start, rail_dir, rail_owner, rail_first = stack_segments([r[2] for r in rail_polys])
+    pwr_bulge = stack_bulges([p[4] for p in pwr_polys], [p[2] for p in pwr_polys])
+    rail_bulge = stack_bulges([r[5] for r in rail_polys], [r[2] for r in rail_polys])
+
+    with rail_profile.stage('cross_segments'):
+        if workers > 1:
+            ips, i_rail, t_rail, i_pwr, t_pwr = cross_parallel(
+                rail_start, rail_dir, rail_bulge, rail_first,
+                pwr_start, pwr_dir, pwr_bulge, pwr_first, workers)
+        else:
+            ips, i_rail, t_rail, i_pwr, t_pwr = cross_segments(
+                rail_start, rail_dir, pwr_start, pwr_dir, CROSS_ENGINE, rail_bulge, pwr_bulge)
+    rail_profile.count('intersections_found', len(ips))
+
+    # 按 (铁路折线, 电力折线) 分组，组内保持 (铁路线段, 电力线段) 顺序，并去掉重复交点
+    r_own, p_own = rail_owner[i_rail], pwr_owner[i_pwr]
+    order = np.lexsort((i_pwr, i_rail, p_own, r_own))
+    keep = order[dedupe_hits(ips[order], r_own[order] * len(pwr_polys) + p_own[order], TOLERANCE)]
+    ips, i_rail, t_rail, i_pwr, t_pwr = ips[keep], i_rail[keep], t_rail[keep], i_pwr[keep], t_pwr[keep]
+    r_own, p_own = r_own[keep], p_own[keep]
+    rail_profile.count('crossings', len(ips))
+
+    # 里程与方向直接取自交点所在的铁路线段（圆弧段取交点处的切线和弧长）
+    _, rail_tan = segment_points_tangents(rail_start, rail_dir, rail_bulge, i_rail, t_rail)
+    _, pwr_tan = segment_points_tangents(pwr_start, pwr_dir, pwr_bulge, i_pwr, t_pwr)
+    seg_len = segment_lengths(rail_dir[i_rail], rail_bulge[i_rail])
+
+    pairs = {}
+    for k in range(len(ips)):
+        _, _, pts, cum_len, offset, _ = rail_polys[r_own[k]]
+        local = i_rail[k] - rail_first[r_own[k]]
+        mileage = offset + cum_len[local] + t_rail[k] * seg_len[k]
+        angle = right_angle(rail_tan[k], pwr_tan[k])
+        pairs.setdefault((int(r_own[k]), int(p_own[k])), []).append({
+            'Mileage_m': round(float(mileage), 3),
+            'Angle': format_angle(angle),
+            'Remark': pwr_polys[p_own[k]][3],
+            'Category': pwr_polys[p_own[k]][5],
+            'Angle_deg': angle,
+        })
+    return pairs
+
+# ---------- 增量计算 ------------------------------------------------
+def _entity_key(handle, layer, k):
+    """折线的稳定标识：优先用实体句柄，没有句柄的图纸退化为 图层#序号。"""
+    return str(handle) if handle not in (None, '', 'None') else f'{layer}#{k}'
+
+def _geom_hash(layer, pts, bulge, start=0.0):
+    """
+    图层名 + 顶点坐标 + 凸度 + 起点累积长度的哈希，任一变化都视为改动。
+    同一图层前面的分段变长或变短时，后面分段的里程随之变化，因此起点累积长度也计入。
+    """
+    h = hashlib.sha1(layer.encode('utf-8'))
+    h.update(np.ascontiguousarray(pts, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(bulge, dtype=np.float64).tobytes())
+    h.update(np.float64(start).tobytes())
+    return h.hexdigest()
+
+def _load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _save_state(path, state):
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def incremental_pairs(state_path, rail_polys, pwr_polys, rail_layers, workers=1):
+    """
+    增量版 cross_rows：与 state_path 中上次运行的句柄和几何哈希比较，
+    只对新增或改动的铁路 × 全部电力、未变铁路 × 新增或改动的电力重新求交，
+    两者都未变的组合沿用上次结果，删除的折线其结果自然丢弃。结束后写回新状态。
+    """
+    config = {'version': STATE_VERSION, 'tolerance': TOLERANCE, 'rail_layers': rail_layers}
+    rail_hash = {r[0]: _geom_hash(r[1], r[2], r[5], r[3][0]) for r in rail_polys}
+    pwr_hash = {p[0]: _geom_hash(p[1] + '|' + p[5], p[2], p[4]) for p in pwr_polys}
 
-    # 转成 DataFrame 并写入 Excel，仅包含 三 列：Mileage_m, Angle, Remark
-    df = pd.DataFrame(rows, columns=['Mileage_m', 'Angle', 'Remark'])
-    output = dxf_path.with_suffix('.rail_power_dynamic.xlsx')
-    df.to_excel(output, index=False)
+    state = _load_state(state_path)
+    if state is None or state.get('config') != config:
+        state = {'rails': {}, 'power': {}, 'pairs': []}    # 无状态或配置变化：全部重算
+    rail_new = [k for k, r in enumerate(rail_polys) if state['rails'].get(r[0]) != rail_hash[r[0]]]
+    pwr_new = [k for k, p in enumerate(pwr_polys) if state['power'].get(p[0]) != pwr_hash[p[0]]]
+    rail_same = sorted(set(range(len(rail_polys))) - set(rail_new))
+    pwr_same = sorted(set(range(len(pwr_polys))) - set(pwr_new))
+    print(f"[增量] 需重算：铁路折线 {len(rail_new)}/{len(rail_polys)}，"
+          f"电力折线 {len(pwr_new)}/{len(pwr_polys)}")
+
+    pairs = {}
+    # 1) 新增或改动的铁路 × 全部电力
+    if rail_new:
+        sub = cross_rows([rail_polys[k] for k in rail_new], pwr_polys, workers)
+        for (a, b), rows in sub.items():
+            pairs[rail_new[a], b] = rows
+    # 2) 未变的铁路 × 新增或改动的电力
+    if rail_same and pwr_new:
+        sub = cross_rows([rail_polys[k] for k in rail_same],
+                         [pwr_polys[k] for k in pwr_new], workers)
+        for (a, b), rows in sub.items():
+            pairs[rail_same[a], pwr_new[b]] = rows
+    # 3) 两者都未变：沿用上次结果
+    rail_pos = {rail_polys[k][0]: k for k in rail_same}
+    pwr_pos = {pwr_polys[k][0]: k for k in pwr_same}
+    for rail_key, pwr_key, rows in state['pairs']:
+        if rail_key in rail_pos and pwr_key in pwr_pos:
+            pairs[rail_pos[rail_key], pwr_pos[pwr_key]] = [
+                {'Mileage_m': m, 'Angle': a, 'Remark': r, 'Category': c, 'Angle_deg': d}
+                for m, a, r, c, d in rows]
+
+    _save_state(state_path, {
+        'config': config,
+        'rails': rail_hash,
+        'power': pwr_hash,
+        'pairs': [[rail_polys[a][0], pwr_polys[b][0],
+                   [[row['Mileage_m'], row['Angle'], row['Remark'], row['Category'], row['Angle_deg']]
+                    for row in rows]]
+                  for (a, b), rows in sorted(pairs.items())],
+    })
+    return pairs
+
+class Crossing:
+    """
+    一个交叉点：里程（米，3 位小数）、右侧夹角（“度°分′”）、备注、类别、所在铁路图层
+    及全精度的右侧夹角 angle_deg（度）。
+    """
+    __slots__ = ('mileage', 'angle', 'remark', 'category', 'layer', 'angle_deg')
+
+    def __init__(self, mileage, angle, remark, category, layer, angle_deg=None):
+        self.mileage = mileage
+        self.angle = angle
+        self.remark = remark
+        self.category = category
+        self.layer = layer
+        self.angle_deg = angle_deg
+
+    def as_row(self):
+        """转为 find_crossings 的一行（写表时只取 COLUMNS 中的列）。"""
+        return {'Mileage_m': self.mileage, 'Angle': self.angle,
+                'Remark': self.remark, 'Category': self.category, 'Angle_deg': self.angle_deg}
+
+    def __repr__(self):
+        return (f'Crossing({self.mileage!r}, {self.angle!r}, {self.remark!r}, '
+                f'{self.category!r}, {self.layer!r}, {self.angle_deg!r})')
+
+def _poly_bounds(polys, bulges):
+    """各折线的包围盒 (lo, hi)，圆弧段计入弧上的极值点；没有线段的折线为空盒。"""
+    starts, dirs, owner, _ = stack_segments(polys)
+    seg_lo, seg_hi = segment_bounds(starts, dirs, stack_bulges(bulges, polys))
+    lo = np.full((len(polys), 2), np.inf)
+    hi = np.full((len(polys), 2), -np.inf)
+    np.minimum.at(lo, owner, seg_lo)
+    np.maximum.at(hi, owner, seg_hi)
+    return lo, hi
+
+def _as_records(rail, rows):
+    """一条铁路分段的行（按电力折线顺序）转为按里程排序的 Crossing 列表（同里程保持折线顺序）。"""
+    rows = sorted(rows, key=lambda row: row['Mileage_m'])
+    return [Crossing(row['Mileage_m'], row['Angle'], row['Remark'], row['Category'], rail[1],
+                     row['Angle_deg'])
+            for row in rows]
+
+def _rail_records(rail, pwr_polys, pwr_bounds):
+    """
+    一条铁路分段与交叉折线求交（串行），返回按里程排序的 Crossing 列表。
+    只把包围盒与该分段重叠的交叉折线送去求交。
+    """
+    (lo, hi), (pwr_lo, pwr_hi) = _poly_bounds([rail[2]], [rail[5]]), pwr_bounds
+    near = np.flatnonzero(((pwr_lo <= hi + TOLERANCE) & (pwr_hi >= lo - TOLERANCE)).all(axis=1))
+    pairs = cross_rows([rail], [pwr_polys[k] for k in near]) if len(near) else {}
+    return _as_records(rail, [row for key in sorted(pairs) for row in pairs[key]])
+
+def _section_records(rail_polys, pwr_polys, workers):
+    """
+    返回 records(k)：第 k 条铁路分段按里程排序的 Crossing 列表。
+    串行时在取用时才求该分段的交叉；并行时全部分段一次性求交，只启动一个进程池，
+    再按分段取用（逐段求交会为每个分段各启动一个进程池，反而比串行慢）。
+    """
+    if workers > 1:
+        pairs = cross_rows(rail_polys, pwr_polys, workers)
+        by_rail = {}
+        for r, p in sorted(pairs):
+            by_rail.setdefault(r, []).extend(pairs[r, p])
+        return lambda k: _as_records(rail_polys[k], by_rail.pop(k, []))
+    pwr_bounds = _poly_bounds([p[2] for p in pwr_polys], [p[4] for p in pwr_polys])
+    return lambda k: _rail_records(rail_polys[k], pwr_polys, pwr_bounds)
+
+def _merged(rail_polys, pwr_polys, workers):
+    """
+    k 路归并：分段按起点里程排队，堆顶里程达到下一个分段的起点时才求该分段的交叉，
+    因此同时留在内存中的只有里程范围相互重叠的分段（workers > 1 时各分段的交叉已一次性算好，
+    见 _section_records）。同里程时按分段原顺序输出，结果与 find_crossings 的排序完全一致。
+    """
+    # 交叉里程不小于分段起点（里程保留 3 位小数，留 0.001 余量）
+    starts = sorted((r[4] + float(r[3][0]) - 1e-3, k) for k, r in enumerate(rail_polys))
+    records = _section_records(rail_polys, pwr_polys, workers)
+    heap = []
+    pos = 0
+    while heap or pos < len(starts):
+        if pos < len(starts) and (not heap or heap[0][0] >= starts[pos][0]):
+            _, k = starts[pos]
+            pos += 1
+            for seq, rec in enumerate(records(k)):
+                heapq.heappush(heap, (rec.mileage, k, seq, rec))
+            continue
+        yield heapq.heappop(heap)[3]
+
+def iter_crossings(dxf_path, rail_layers=None, workers=None, rules=None, ordered=False, binary=None):
+    """
+    逐条铁路分段生成 Crossing 记录，可边算边处理、显示进度或提前停止。
+    ordered 为假时按分段顺序输出，每段内按里程排序；为真时做 k 路归并，整体按里程排序。
+    没有任何匹配 rules 的图层时什么也不生成。
+    """
+    rail_layers = RAIL_LAYERS if rail_layers is None else rail_layers
+    rules = CROSS_RULES if rules is None else rules
+    workers = _workers(workers)
+    inputs = load_inputs(dxf_path, rail_layers, rules, binary)
+    if inputs is None:
+        return
+    rail_polys, pwr_polys = inputs
+    if ordered:
+        yield from _merged(rail_polys, pwr_polys, workers)
+    else:
+        records = _section_records(rail_polys, pwr_polys, workers)
+        for k in range(len(rail_polys)):
+            yield from records(k)
+
+@rail_profile.timed('compute')
+def compute(dxf_path: Path, workers=None, incremental=None, fmt=None, rules=None, binary=None):
+    incremental = INCREMENTAL if incremental is None else incremental
+    if incremental:
+        rows = find_crossings(dxf_path, workers=workers, incremental=True, rules=rules, binary=binary)
+    else:
+        inputs = load_inputs(dxf_path, RAIL_LAYERS, CROSS_RULES if rules is None else rules, binary)
+        rows = None if inputs is None else (
+            rec.as_row() for rec in _merged(*inputs, _workers(workers)))
+    if rows is None:
+        return
+
+    # 按里程顺序边求交边写入结果表：Mileage_m, Angle, Remark, Category
+    output = table_path(dxf_path, fmt)
+    with rail_profile.stage('write_table'):
+        write_table(rows, output, COLUMNS)
     print(f"[OK] 结果已保存 → {output.name}")
 
+def table_path(dxf_path, fmt=None):
+    """结果表路径：<输入>.rail_power_dynamic.<fmt>（缺省 OUTPUT_FORMAT）。"""
+    return Path(dxf_path).with_suffix(f'.rail_power_dynamic.{fmt or OUTPUT_FORMAT}')
+
+@rail_profile.timed('pipeline')
+def annotate_crossings(dxf_path, rail_layers=None, workers=None, incremental=None, rules=None,
+                       binary=None, table=None, out_path=None):
+    """
+    一体化流程：求交后在同一进程中直接绘制标注（rail_power_draw.draw_annotations），不经过表格往返。
+    - 底图只读一次；rail_power_draw.SAVE_MODE 为 'full' 时求交与保存共用同一个已载入的文档
+    - 标注定位用的就是求交时准备好的铁路分段，不再查缓存或重建
+    - 右侧夹角以全精度浮点数传给绘制，不经“度°分′”格式化再解析
+    table 给出路径时顺带写出结果表。binary 缺省取 BINARY_SIDECAR，为真时经二进制副本读取并输出二进制 DXF。
+    返回 (按里程排序的交叉行, {'placed', 'skipped'})；没有任何匹配 rules 的图层时返回 None。
+    """
+    rail_layers = RAIL_LAYERS if rail_layers is None else rail_layers
+    rules = CROSS_RULES if rules is None else rules
+    binary = BINARY_SIDECAR if binary is None else binary
+    incremental = INCREMENTAL if incremental is None else incremental
+    # 底图只哈希一次：缓存与二进制副本共用同一 digest，并连同读取源一起交给 load_inputs
+    digest = file_digest(dxf_path) if USE_CACHE else None
+    source = sidecar(dxf_path, digest) if binary else dxf_path
+    doc = None
+    if rail_power_draw.SAVE_MODE == 'full':
+        with rail_profile.stage('read_dxf'):
+            doc = ezdxf.readfile(source)
+
+    inputs = load_inputs(dxf_path, rail_layers, rules, binary, doc, source, digest)
+    if inputs is None:
+        return
+    rows = _sorted_rows(dxf_path, inputs, rail_layers, _workers(workers), incremental)
+    if table:
+        with rail_profile.stage('write_table'):
+            write_table(rows, table, COLUMNS)
+        print(f"[OK] 结果已保存 → {Path(table).name}")
+
+    sections = [Alignment(pts, bulge, offset, cum) for _, _, pts, cum, offset, bulge in inputs[0]]
+    stats = rail_power_draw.draw_annotations(
+        dxf_path, source, sections, [row['Mileage_m'] for row in rows],
+        [row['Angle_deg'] for row in rows], out_path, doc, binary)
+    return rows, stats
+
 if __name__ == '__main__':
-    path = Path(DXF_FILE)
+    parser = argparse.ArgumentParser(description='计算铁路与电力线等交叉的里程和右侧夹角')
+    parser.add_argument('dxf', nargs='?', default=DXF_FILE, help='DXF 文件路径')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='并行进程数（1 为串行，0 为全部 CPU 核心）')
+    parser.add_argument('--format', choices=WRITE_FORMATS, default=OUTPUT_FORMAT,
+                        help='结果表格式（csv 最快）')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help='记录各阶段耗时、峰值内存和计数，写入 JSON（缺省 <输入>.profile.json）')
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL,
+                        help='只重算相对上次运行改动的折线（状态保存在 <输入>.rail_power_state.json）')
+    parser.add_argument('--rule', action='append', metavar='前缀=类别',
+                        help='交叉类别规则，可重复给出，如 --rule 电力=电力 --rule 道路=道路（替换 CROSS_RULES）')
+    parser.add_argument('--binary', action='store_true', default=BINARY_SIDECAR,
+                        help='读底图的二进制副本（首次运行时生成，按内容哈希缓存）')
+    parser.add_argument('--draw', action='store_true',
+                        help='求交后在同一进程中直接绘制标注（不经过表格往返，见 rail_power_draw.py）')
+    parser.add_argument('--no-table', action='store_true',
+                        help='与 --draw 同用：只输出标注图，不写结果表')
+    args = parser.parse_args()
+    rules = dict(rule.split('=', 1) if '=' in rule else (rule, rule) for rule in args.rule) if args.rule else None
+    path = Path(args.dxf)
     if not path.exists():
         print('DXF 文件未找到：', path)
     else:
-        compute(path)
+        report = None if args.profile is None else args.profile or path.with_suffix('.profile.json')
+        with rail_profile.session(report):
+            if args.draw:
+                annotate_crossings(path, workers=args.workers, incremental=args.incremental,
+                                   rules=rules, binary=args.binary,
+                                   table=None if args.no_table else table_path(path, args.format))
+            else:
+                compute(path, args.workers, args.incremental, args.format, rules, args.binary)
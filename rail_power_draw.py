@@ -3,17 +3,24 @@
 """
 rail_power_draw.py — 根据“里程-角度”表格，在 DXF 中对应铁路中心线上
 绘制一定长度的标注折线（以表格中角度为右侧夹角）。
+不需要表格时可用 rail_power.py --draw 一步完成求交和标注（见 rail_power.annotate_crossings）。
 
 使用前请安装依赖：
-  pip install ezdxf pandas
+  pip install ezdxf numpy openpyxl
 """
 
-import math
+import argparse
 import re
 import ezdxf
-import pandas as pd
+import numpy as np
 from pathlib import Path
-from ezdxf.math import Vec2
+from rail_alignment import Alignment, MileageIndex
+from rail_loader import load_polylines, group_polylines
+from rail_cache import file_digest, cached_rails, prepare_rails
+import rail_profile
+from rail_table import read_table
+from rail_splice import save_additions
+from rail_binary import sidecar
 
 # ---------- 配置区 --------------------------------------------------
 
@@ -30,7 +37,7 @@ RAIL_LAYERS = {
 # 2. 要处理的 DXF 文件路径（修改为你自己的文件路径）
 DXF_FILE      = r'break.dxf'
 
-# 3. 输入“里程-角度”表格路径，支持 .xlsx、.xls 或 .csv
+# 3. 输入“里程-角度”表格路径，支持 .xlsx、.xls、.csv、.parquet 或 .feather
 #    表格第一列必须是里程（浮点数，单位米），第二列必须是角度（格式如 "12°30'"、"45°0'"）。
 TABLE_FILE    = r'mileage_angle.xlsx'
 
@@ -40,90 +47,27 @@ ANNOT_LENGTH  = 1000
 # 5. 绘制标注的目标图层名称（如果不存在会自动创建）
 ANNOT_LAYER   = '标注'
 
-# 6. 加密阈值：如果相邻两个铁路顶点距离大于此值（米），则插入中间点
-MAX_SEG_LEN   = 5.0
+# 6. 加密阈值：None 为按直线/圆弧图元精确定位（推荐）；
+#    给数值（米）时沿图元插入中间点，按弦近似
+MAX_SEG_LEN   = None
 
 # 7. 几何容差
 TOLERANCE     = 1e-6
 
-# ------------------------------------------------------------------
-
+# 8. 是否使用铁路折线的磁盘缓存（见 rail_cache.py）
+USE_CACHE     = True
 
-def poly2d(entity):
-    """把 LWPOLYLINE 或 POLYLINE 投影为 Vec2 列表。"""
-    if entity.dxftype() not in ('LWPOLYLINE', 'POLYLINE'):
-        raise TypeError(f'Unsupported entity type: {entity.dxftype()}')
-    return [Vec2(pt[:2]) for pt in entity.get_points()]
+# 9. 输出方式（见 rail_splice.py）：'splice' 在原文件副本末尾追加标注（快）；
+#    'overlay' 只把标注写成一个小 DXF 供外部参照；'full' 载入整张图后重新保存
+SAVE_MODE     = 'splice'
 
+# 10. 二进制 DXF：True 时以底图的二进制副本（按内容哈希缓存，见 rail_binary.py）为读取和拼接的源，
+#     输出二进制 DXF，后续 connect 等步骤读取更快；输入本身是二进制 DXF 时无需副本
+BINARY_DXF    = False
 
-def densify(points, max_len=MAX_SEG_LEN):
-    """
-    对一段折线的点坐标列表做“加密”，
-    如果相邻点距离 > max_len，就在中间插入等间距的新点。
-    """
-    dense = []
-    for i in range(len(points) - 1):
-        a, b = points[i], points[i + 1]
-        dense.append(a)
-        dist = a.distance(b)
-        if dist > max_len:
-            # 插入 int(dist//max_len) - 1 个等距点
-            steps = int(dist // max_len)
-            for k in range(1, steps + 1):
-                t = k / (steps + 1)
-                dense.append(a + (b - a) * t)
-    dense.append(points[-1])
-    return dense
-
-
-def calc_cum_len(vecs):
-    """
-    对于密集点列表 vecs，计算从第 0 个点开始到每个点的累积长度。
-    返回一个与 vecs 等长的数组 cum，其中 cum[i] = 从 vecs[0] 到 vecs[i] 的距离。
-    """
-    cum = [0.0]
-    for i in range(len(vecs) - 1):
-        cum.append(cum[-1] + vecs[i].distance(vecs[i + 1]))
-    return cum
+# ------------------------------------------------------------------
 
-
-def get_point_and_tangent(vecs, cum, target_len):
-    """
-    在点列表 vecs（已 densify 过）上，找到累积长度 closest to target_len 处的坐标和切线方向。
-    - cum: 对应 vecs 的累积长度数组
-    - target_len: 目标长度
-    返回 (pt, t_rail)，其中 pt 是 Vec2 坐标，t_rail 是切线单位向量。
-    """
-    # 如果 target_len 超过最后一点，则固定在终点
-    if target_len <= 0:
-        pt = vecs[0]
-        # 切线取第二段
-        t = vecs[1] - vecs[0] if len(vecs) >= 2 else Vec2(1, 0)
-        return pt, t.normalize() if t.magnitude > TOLERANCE else Vec2(1, 0)
-
-    if target_len >= cum[-1]:
-        pt = vecs[-1]
-        t = vecs[-1] - vecs[-2] if len(vecs) >= 2 else Vec2(1, 0)
-        return pt, t.normalize() if t.magnitude > TOLERANCE else Vec2(1, 0)
-
-    # 否则在两段之间插值
-    for i in range(len(cum) - 1):
-        if cum[i] <= target_len <= cum[i + 1]:
-            a, b = vecs[i], vecs[i + 1]
-            seg_len = cum[i + 1] - cum[i]
-            if seg_len < TOLERANCE:
-                # 退化到顶点处
-                pt = a
-                t = b - a
-            else:
-                ratio = (target_len - cum[i]) / seg_len
-                pt = a + (b - a) * ratio
-                t = b - a
-            t_rail = t.normalize() if t.magnitude > TOLERANCE else Vec2(1, 0)
-            return pt, t_rail
-
-    # 实际不会走到这里
-    return vecs[-1], Vec2(1, 0)
+_DMS = re.compile(r"^\s*(\d+)\s*°\s*(\d+)\s*'\s*$")
 
 
 def parse_angle(angle_str: str) -> float:
@@ -143,8 +87,7 @@ def parse_angle(angle_str: str) -> float:
 
     # 情况 A：形如 123°45'
     # 正确匹配形如 "12°30'" 的角度格式
-    pattern1 = re.compile(r"^\s*(\d+)\s*°\s*(\d+)\s*'\s*$")
-    m1 = pattern1.match(s)
+    m1 = _DMS.match(s)
     if m1:
         deg = int(m1.group(1))
         minute = int(m1.group(2))
@@ -165,22 +108,181 @@ def parse_angle(angle_str: str) -> float:
         raise ValueError(f"无法解析角度格式：{angle_str}")
 
 
+def parse_angles(values):
+    """
+    按列解析整列角度，规则与 parse_angle(str(v)) 相同。
+    返回 (角度数组, 成功掩码)；解析失败的行角度为 NaN、掩码为 False。
+    纯数字、“度分”四位数各用一次数组转换，只有 12°30' 形式逐个正则匹配。
+    """
+    texts = np.array([str(v).strip() for v in values], dtype=str)
+    angles = np.full(len(texts), np.nan)
+    ok = np.zeros(len(texts), dtype=bool)
+    if not len(texts):
+        return angles, ok
+
+    lengths = np.char.str_len(texts)
+    packed = np.char.isdigit(texts) & (lengths >= 3) & (lengths <= 4)
+    dms = np.char.find(texts, '°') >= 0
+    plain = ~(packed | dms)
+
+    # 情况 A：12°30'
+    for i in np.flatnonzero(dms):
+        m = _DMS.match(texts[i])
+        if m:
+            angles[i] = int(m.group(1)) + int(m.group(2)) / 60.0
+            ok[i] = True
+
+    # 情况 B：6815 → 68°15'；情况 C：其余按浮点数整列转换。
+    # 整列中有无法转换的值时，这部分改为逐个解析
+    rest = []
+    idx = np.flatnonzero(packed)
+    try:
+        values = texts[idx].astype(np.int64)
+        angles[idx] = values // 100 + (values % 100) / 60.0
+        ok[idx] = True
+    except ValueError:
+        rest.extend(idx)
+    idx = np.flatnonzero(plain)
+    try:
+        angles[idx] = texts[idx].astype(float)
+        ok[idx] = True
+    except ValueError:
+        rest.extend(idx)
+    for i in rest:
+        try:
+            angles[i] = parse_angle(texts[i])
+            ok[i] = True
+        except ValueError:
+            pass
+    return angles, ok
+
 
-def rotate_vec(vec: Vec2, angle_deg: float) -> Vec2:
+def rotate_vecs(vecs, angles_deg):
     """
-    将 vec（单位向量）绕原点顺时针旋转 angle_deg 度，返回新的 Vec2。
+    将 (N,2) 单位向量逐行绕原点顺时针旋转 angles_deg 度，返回新的单位向量数组。
     注意：顺时针旋转即用 -angle_deg 作为数学上逆时针旋转的负值。
     """
-    rad = math.radians(-angle_deg)
-    cosA = math.cos(rad)
-    sinA = math.sin(rad)
-    x, y = vec.x, vec.y
-    x_new = x * cosA - y * sinA
-    y_new = x * sinA + y * cosA
-    return Vec2(x_new, y_new).normalize()
+    rad = np.radians(-np.asarray(angles_deg, dtype=float))
+    cosA = np.cos(rad)
+    sinA = np.sin(rad)
+    x, y = vecs[:, 0], vecs[:, 1]
+    out = np.column_stack((x * cosA - y * sinA, x * sinA + y * cosA))
+    return out / np.hypot(out[:, 0], out[:, 1])[:, None]
+
+
+@rail_profile.timed('annotate')
+def annotate(dxf_path, mileage_list, angle_list, rail_layers=None, out_path=None, binary=None):
+    """
+    在 dxf_path 的铁路中心线上按“里程-角度”逐行绘制标注并另存为 out_path
+    （缺省为 <原名>_with_annotations.dxf，overlay 方式为 <原名>_annotations_overlay.dxf）。
+    binary（缺省 BINARY_DXF）为真时经底图的二进制副本读取并输出二进制 DXF。
+    返回 {'placed': 已绘制行数, 'skipped': 跳过行数}。
+    """
+    rail_layers = RAIL_LAYERS if rail_layers is None else rail_layers
+    binary = BINARY_DXF if binary is None else binary
+
+    # 1. 先查铁路图层缓存；二进制方式取底图的二进制副本，之后的读取和拼接都用它
+    with rail_profile.stage('cache_lookup'):
+        digest = file_digest(dxf_path) if USE_CACHE else None
+        rails = cached_rails(digest, rail_layers, MAX_SEG_LEN)
+    source = sidecar(dxf_path, digest) if binary else dxf_path
+
+    # 2. 只有整图保存时才载入整张图，追加写出时只流式读取缺缓存的铁路图层，
+    #    准备好所有铁路图层的点列及累积长度
+    doc = None
+    if SAVE_MODE == 'full':
+        with rail_profile.stage('read_dxf'):
+            doc = ezdxf.readfile(source)
+    missing = [layer_name for layer_name in rail_layers if layer_name not in rails]
+    layer_polys = {}
+    if missing and doc is not None:
+        layer_polys = group_polylines(doc.modelspace(), lambda name: name in missing)
+    elif missing:
+        with rail_profile.stage('read_dxf'):
+            _, layer_polys = load_polylines(source, lambda name: name in missing)
+    rails.update(prepare_rails(layer_polys, missing, rail_layers, MAX_SEG_LEN, digest))
+
+    # 每个图层的折线已按首尾拼接为若干分段（见 rail_cache.py），按图层顺序排成一列
+    sections = []
+    for layer_name, offset in rail_layers.items():
+        if not rails[layer_name]:
+            print(f"Warning: 图层 {layer_name} 未找到任何折线，已跳过。")
+            continue
+        sections.extend(Alignment(pts, bulge, offset, cum) for _, pts, cum, bulge in rails[layer_name])
+
+    # 3. 整列解析角度，之后与一体化流程相同
+    angles, _ = parse_angles(angle_list)
+    return draw_annotations(dxf_path, source, sections, mileage_list, angles, out_path, doc, binary,
+                            angle_list)
+
+
+def draw_annotations(dxf_path, source, sections, mileage_list, angles, out_path=None, doc=None,
+                     binary=False, angle_text=None):
+    """
+    在按图层顺序排列的铁路分段 sections（Alignment 列表）上，按里程和右侧夹角（度，浮点数，
+    NaN / inf 为无效）逐行绘制标注，以 source 为底图写出 out_path（缺省同 annotate）。
+    doc 为已载入的整张图（SAVE_MODE 为 'full' 时使用，缺省现读）；angle_text 为原始角度文本，
+    只用于角度解析失败时的提示。返回 {'placed': 已绘制行数, 'skipped': 跳过行数}。
+    """
+    if SAVE_MODE == 'full' and doc is None:
+        with rail_profile.stage('read_dxf'):
+            doc = ezdxf.readfile(source)
+    index = MileageIndex([s.start_mileage for s in sections], [s.end_mileage for s in sections], TOLERANCE)
+
+    # 一次性确定每行所属分段（里程落在其范围内的第一个分段）
+    n_rows = len(mileage_list)
+    angles = np.asarray(angles, dtype=float)
+    angle_ok = np.isfinite(angles)
+    mileages = np.array(mileage_list, dtype=float)
+    section_of = np.where(angle_ok, index.lookup(mileages), -1)   # 行 → 分段序号，-1 为未找到
+
+    # 提示信息按表格行序输出
+    for row in np.flatnonzero(section_of < 0):
+        if not angle_ok[row]:
+            ang_str = angles[row] if angle_text is None else angle_text[row]
+            try:
+                parse_angle(str(ang_str))
+                # 能解析但得到 NaN / inf（如 'nan'、xlsx 中的空数值单元格）：同样逐行提示，不静默丢弃
+                print(f"[跳过] 角度无效（{ang_str}）：不是有限数值")
+            except Exception as e:
+                print(f"[跳过] 角度解析失败（{ang_str}）：{e}")
+        else:
+            print(f"[警告] 里程 {mileage_list[row]} 米不在任何铁路图层的范围内，已跳过。")
+
+    # 每个分段一次性批量插值定位，整批旋转求端点
+    placed = np.flatnonzero(section_of >= 0)
+    starts = np.empty((n_rows, 2))
+    ends = np.empty((n_rows, 2))
+    order = placed[np.argsort(section_of[placed], kind='stable')]
+    groups = np.split(order, np.flatnonzero(np.diff(section_of[order])) + 1) if len(order) else []
+    for rows in groups:
+        with rail_profile.stage('locate'):
+            pts, tangents = sections[section_of[rows[0]]].locate(mileages[rows])
+        # 顺时针旋转 t_rail 得到 t_pwr，以 pt 为中心沿 t_pwr 方向两端各延伸 ANNOT_LENGTH/2
+        offsets = rotate_vecs(tangents, angles[rows]) * (ANNOT_LENGTH / 2.0)
+        starts[rows] = pts - offsets
+        ends[rows] = pts + offsets
+
+    def emit(msp):
+        # 按表格行序整批写出：每条标注是一条两点折线（其实就是一条直线段）
+        with rail_profile.stage('emit'):
+            attribs = {'layer': ANNOT_LAYER, 'color': 1}
+            for x2, y2, x1, y1 in np.hstack((starts[placed], ends[placed])).tolist():
+                msp.add_lwpolyline([(x2, y2), (x1, y1)], format='xy', dxfattribs=attribs)
+    rail_profile.count('rows_placed', len(placed))
+    rail_profile.count('rows_skipped', n_rows - len(placed))
+
+    # 写出“标注”图层（不存在时创建）和标注线
+    dxf_path = Path(dxf_path)
+    suffix = '_annotations_overlay.dxf' if SAVE_MODE == 'overlay' else '_with_annotations.dxf'
+    out_path = Path(out_path) if out_path else dxf_path.with_name(dxf_path.stem + suffix)
+    with rail_profile.stage('save_dxf'):
+        save_additions(source, out_path, {ANNOT_LAYER: 1}, emit, SAVE_MODE, doc, binary)
+    print(f"[OK] 标注已完成，输出文件 → {out_path.name}")
+    return {'placed': len(placed), 'skipped': n_rows - len(placed)}
 
 
-def main():
+def main(binary=None):
     # 1. 检查文件存在性
     dxf_path = Path(DXF_FILE)
     if not dxf_path.exists():
@@ -192,96 +294,30 @@ def main():
         print(f"里程-角度表格未找到：{table_path}")
         return
 
-    # 2. 读取 DXF
-    doc = ezdxf.readfile(dxf_path)
-    msp = doc.modelspace()
-
-    # 3. 准备“标注”图层
-    if ANNOT_LAYER not in {layer.dxf.name for layer in doc.layers}:
-        doc.layers.new(name=ANNOT_LAYER, dxfattribs={'color': 1})
-
-    # 4. 读取表格（兼容 .xlsx/.xls/.csv）
+    # 2. 读取表格（格式由扩展名决定，见 rail_table.py）
     #    假设表格有表头，里程列在第 0 列，角度列在第 1 列
-    suffix = table_path.suffix.lower()
-    if suffix in ('.xlsx', '.xls'):
-        df = pd.read_excel(table_path, header=0)
-    elif suffix == '.csv':
-        df = pd.read_csv(table_path, header=0)
-    else:
-        raise ValueError("只能读取 .xlsx/.xls 或 .csv 格式的表格。")
+    with rail_profile.stage('read_table'):
+        _, rows = read_table(table_path)
 
     # 取出第一列和第二列
-    # 若表格没有表头，可将 header=None，并用 df.iloc[:,0], df.iloc[:,1]
-    mileage_list = df.iloc[:, 0].tolist()
-    angle_list   = df.iloc[:, 1].tolist()
+    mileage_list = [row[0] for row in rows]
+    angle_list   = [row[1] if len(row) > 1 else None for row in rows]
 
     if len(mileage_list) != len(angle_list):
         print("表格行数不匹配，请检查第一列和第二列是否对应。")
         return
 
-    # 5. 预先处理：先把所有铁路图层的密集点及累积长度缓存起来
-    rail_data = {}  # key = 图层名，value = (dense_pts, cum_len, offset)
-    for layer_name, offset in RAIL_LAYERS.items():
-        ents = list(msp.query(f'LWPOLYLINE[layer=="{layer_name}"]')) + \
-               list(msp.query(f'POLYLINE[layer=="{layer_name}"]'))
-        if not ents:
-            print(f"Warning: 图层 {layer_name} 未找到任何折线，已跳过。")
-            continue
-        # 假设每个图层只有一条铁路，如果有多条，可以自行扩展
-        rail_ent = ents[0]
-        pts2d = poly2d(rail_ent)
-        dense_pts = densify(pts2d, max_len=MAX_SEG_LEN)
-        cum_len   = calc_cum_len(dense_pts)
-        rail_data[layer_name] = (dense_pts, cum_len, offset)
-
-    # 6. 对表格中每一行，去对应的铁路图层上定位并画线
-    for M, ang_str in zip(mileage_list, angle_list):
-        try:
-            ang_deg = parse_angle(str(ang_str))
-        except Exception as e:
-            print(f"[跳过] 角度解析失败（{ang_str}）：{e}")
-            continue
-
-        placed = False
-        # 在哪个铁路图层？寻找满足 offset <= M <= offset + total_length
-        for layer_name, (dense_pts, cum_len, offset) in rail_data.items():
-            total_len = cum_len[-1]
-            # 表格中 M 已经是“含偏置”的里程，计算本地长度
-            local_len = M - offset
-            if local_len < -TOLERANCE or local_len > total_len + TOLERANCE:
-                # 说明这条铁路不包含该里程，继续下一个图层
-                continue
-
-            # 在当前图层上插值定位
-            pt, t_rail = get_point_and_tangent(dense_pts, cum_len, local_len)
-            # 顺时针旋转 t_rail 得到 t_pwr
-            t_pwr = rotate_vec(t_rail, ang_deg)
-
-            # 新版：以 pt 为中心，沿 t_pwr 方向两端各延伸 ANNOT_LENGTH/2
-            half_len = ANNOT_LENGTH / 2.0
-
-            # 计算两个端点
-            pt1 = pt + t_pwr * half_len     # 先向 “正向” 延伸半段
-            pt2 = pt - t_pwr * half_len     # 再向 “反向” 延伸半段
-
-            # 绘制一条双向延伸的折线（其实就是一条直线段）
-            msp.add_lwpolyline(
-                [(pt2.x, pt2.y), (pt1.x, pt1.y)],
-                dxfattribs={'layer': ANNOT_LAYER, 'color': 1}
-            )
-
-
-            placed = True
-            break  # 找到所属图层后就不继续再找了
-
-        if not placed:
-            print(f"[警告] 里程 {M} 米不在任何铁路图层的范围内，已跳过。")
-
-    # 7. 保存修改后的 DXF
-    out_path = dxf_path.with_name(dxf_path.stem + '_with_annotations.dxf')
-    doc.saveas(out_path)
-    print(f"[OK] 标注已完成，输出文件 → {out_path.name}")
+    # 3. 绘制并保存
+    annotate(dxf_path, mileage_list, angle_list, binary=binary)
 
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='按里程-角度表格在铁路中心线上绘制标注')
+    parser.add_argument('--profile', nargs='?', const='', metavar='JSON',
+                        help='记录各阶段耗时、峰值内存和计数，写入 JSON（缺省 <DXF>.profile.json）')
+    parser.add_argument('--binary', action='store_true', default=BINARY_DXF,
+                        help='经底图的二进制副本读取，输出二进制 DXF')
+    args = parser.parse_args()
+    report = None if args.profile is None else args.profile or Path(DXF_FILE).with_suffix('.profile.json')
+    with rail_profile.session(report):
+        main(args.binary)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_profile.py — 各流程阶段的耗时、峰值内存与工作量计数
+# 1) stage(名称) 记录一个阶段的墙钟时间和峰值内存，可嵌套，报告中以 “外层/内层” 路径区分
+# 2) count(名称, n) 累加工作量计数：加密后的线段数、测试的线段对、交点数、放置/跳过的行数等
+# 3) 默认关闭：stage 直接返回空上下文，count 只做一次布尔判断，几乎没有开销
+# 4) enable() 之后开始记录，write_report() 把结果写成 JSON；脚本的 --profile 通过 session() 使用
+
+import contextlib
+import functools
+import json
+import time
+import tracemalloc
+
+ENABLED = False
+
+_NULL = contextlib.nullcontext()
+_stack = []                  # 当前嵌套的阶段
+_stages = {}                 # 阶段路径 → [调用次数, 秒数, 峰值字节]
+_counters = {}
+_started = None
+
+
+def enable(memory=True):
+    """开始记录；memory 为真时用 tracemalloc 统计峰值内存（会使运行变慢）。"""
+    global ENABLED, _started
+    reset()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    ENABLED = True
+    _started = time.perf_counter()
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    _stack.clear()
+    _stages.clear()
+    _counters.clear()
+
+
+class _Stage:
+    __slots__ = ('path', 't0', 'base', 'peak')
+
+    def __init__(self, name):
+        self.path = f'{_stack[-1].path}/{name}' if _stack else name
+
+    def __enter__(self):
+        self.base, self.peak = 0, 0
+        if tracemalloc.is_tracing():
+            self.base, outer = tracemalloc.get_traced_memory()
+            if _stack:                       # 重置前把外层已达到的峰值记到外层
+                _stack[-1].peak = max(_stack[-1].peak, outer)
+            tracemalloc.reset_peak()
+        _stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        _stack.pop()
+        peak = 0
+        if tracemalloc.is_tracing():
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            if _stack:
+                _stack[-1].peak = max(_stack[-1].peak, peak)
+        rec = _stages.setdefault(self.path, [0, 0.0, 0])
+        rec[0] += 1
+        rec[1] += seconds
+        rec[2] = max(rec[2], peak - self.base)
+        return False
+
+
+def stage(name):
+    """with stage('read_dxf'): ... —— 关闭时返回空上下文。"""
+    if not ENABLED:
+        return _NULL
+    return _Stage(name)
+
+
+def timed(name):
+    """装饰器版 stage：整个函数作为一个阶段。"""
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Stage(name):
+                return func(*args, **kwargs)
+        return inner
+    return wrap
+
+
+def count(name, n=1):
+    """累加计数器 name。"""
+    if ENABLED:
+        _counters[name] = _counters.get(name, 0) + int(n)
+
+
+def report():
+    """返回当前记录的结构化结果。"""
+    return {
+        'wall_seconds': round(time.perf_counter() - _started, 6) if _started else None,
+        'memory': tracemalloc.is_tracing(),
+        'stages': [{'stage': path, 'calls': calls, 'seconds': round(seconds, 6),
+                    'peak_mb': round(peak / (1024 * 1024), 3)}
+                   for path, (calls, seconds, peak) in _stages.items()],
+        'counters': dict(_counters),
+    }
+
+
+@contextlib.contextmanager
+def session(path, memory=True):
+    """path 为 None 时什么也不做；否则在 with 块内记录，结束后写出报告并关闭。"""
+    if path is None:
+        yield
+        return
+    enable(memory)
+    try:
+        yield
+    finally:
+        write_report(path)
+        disable()
+
+
+def write_report(path):
+    """把报告写成 JSON 文件。"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report(), f, ensure_ascii=False, indent=2)
+    print(f"[OK] 性能报告 → {path}")
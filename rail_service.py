@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+rail_service.py — 常驻内存的里程查询服务（本机 HTTP 或 Unix 套接字）。
+
+启动时读入一张图纸的铁路图层（优先读 rail_cache 磁盘缓存），把各分段的 Alignment
+和里程索引常驻内存；每次请求前检查 DXF 的修改时间，文件变化后自动重新载入。
+单次查询只做数组运算，毫秒级返回。
+
+接口（请求与返回均为 JSON，里程可写作 128350 或 "K128+350"；查询串中的“+”应写作 %2B，
+直接写“+”时会被解码为空格，“K128 350”同样可以识别）：
+  GET  /info                              图纸、图层、分段与载入时间
+  GET  /forward?m=K128%2B350&m=130000     正算：里程 → 坐标、切线、方位角
+  POST /forward   {"mileages": [...]}
+  GET  /inverse?x=553263.3&y=3430423.5    反算：坐标 → 里程、横向偏距（左正右负）
+  POST /inverse   {"points": [[x, y], ...]}
+  GET  /crossings?from=K120&to=K130       电力线交叉点（rail_power.find_crossings，按需计算并缓存）
+  POST /batch     {"forward": [...], "inverse": [...]}
+
+用法示例：
+  python rail_service.py corridor.dxf --config corridor.json --port 8765
+  python rail_service.py corridor.dxf --socket /tmp/rail.sock
+  curl "http://127.0.0.1:8765/forward?m=K128%2B350"
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+import rail_power
+from rail_alignment import Alignment, MileageIndex
+from rail_cache import file_digest, cached_rails, prepare_rails
+from rail_geom import TOLERANCE, as_points
+from rail_loader import load_polylines
+
+HOST        = '127.0.0.1'
+PORT        = 8765
+MAX_SEG_LEN = None           # 与 rail_power_draw.py / mileage_connect.py 相同：None 为按图元精确定位
+USE_CACHE   = True
+
+# 公里数与米数之间为“+”或空白（查询串里未编码的“+”会被解码为空格）
+_MILEAGE = re.compile(r'^\s*[A-Za-z]*\s*(\d+)(?:(?:\s*\+\s*|\s+)(\d+(?:\.\d*)?))?\s*$')
+
+
+def parse_mileage(value):
+    """把 128350、"128350.5"、"K128+350"、"K128 350"、"DK128+350.5"、"K128" 转为米。"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value)
+    m = _MILEAGE.match(text)
+    if m and (m.group(2) is not None or not text.strip().isdigit()):
+        return int(m.group(1)) * 1000.0 + float(m.group(2) or 0.0)
+    try:
+        return float(text)
+    except ValueError:
+        raise ValueError(f'无法解析里程：{value}') from None
+
+
+def format_mileage(mileage):
+    """128350.0 → "K128+350.000"。"""
+    km, rest = divmod(round(float(mileage), 3), 1000.0)
+    return f'K{int(km)}+{rest:07.3f}'
+
+
+class Corridor:
+    """一张图纸的全部铁路分段：sections 与 layers 一一对应，按 RAIL_LAYERS 顺序排列。"""
+
+    def __init__(self, dxf_path, rail_layers, max_seg_len=MAX_SEG_LEN, use_cache=USE_CACHE):
+        self.dxf_path = Path(dxf_path)
+        self.rail_layers = dict(rail_layers)
+        self.mtime = os.stat(self.dxf_path).st_mtime_ns
+        t0 = time.perf_counter()
+
+        digest = file_digest(self.dxf_path) if use_cache else None
+        rails = cached_rails(digest, self.rail_layers, max_seg_len)
+        missing = [name for name in self.rail_layers if name not in rails]
+        if missing:
+            _, layer_polys = load_polylines(self.dxf_path, lambda name: name in missing)
+            rails.update(prepare_rails(layer_polys, missing, self.rail_layers, max_seg_len, digest))
+
+        self.sections, self.layers = [], []
+        for name, offset in self.rail_layers.items():
+            for _, pts, cum, bulge in rails[name]:
+                section = Alignment(pts, bulge, offset, cum)
+                section.nearest(np.empty((0, 2)))          # 预先建立线段索引，查询线程只读
+                self.sections.append(section)
+                self.layers.append(name)
+        self.index = MileageIndex([s.start_mileage for s in self.sections],
+                                  [s.end_mileage for s in self.sections], TOLERANCE)
+        if self.sections:
+            self.lo = np.array([s.lo for s in self.sections])
+            self.hi = np.array([s.hi for s in self.sections])
+        self.load_seconds = time.perf_counter() - t0
+        self._crossings = None
+        self._crossings_lock = threading.Lock()
+
+    def info(self):
+        return {
+            'dxf': str(self.dxf_path),
+            'mtime': self.mtime / 1e9,
+            'load_seconds': round(self.load_seconds, 4),
+            'sections': [{'layer': layer, 'start': s.start_mileage, 'end': s.end_mileage,
+                          'start_text': format_mileage(s.start_mileage),
+                          'end_text': format_mileage(s.end_mileage)}
+                         for layer, s in zip(self.layers, self.sections)],
+        }
+
+    def forward(self, mileages):
+        """一批里程 → [{mileage, layer, x, y, tangent, bearing}, ...]，不在任何分段内的为 found=False。"""
+        m = np.array([parse_mileage(v) for v in mileages], dtype=np.float64)
+        section_of = self.index.lookup(m)
+        pts = np.full((len(m), 2), np.nan)
+        tan = np.full((len(m), 2), np.nan)
+        for k in np.unique(section_of[section_of >= 0]):
+            rows = np.flatnonzero(section_of == k)
+            pts[rows], tan[rows] = self.sections[k].locate(m[rows])
+        out = []
+        for i in range(len(m)):
+            item = {'mileage': float(m[i]), 'text': format_mileage(m[i]), 'found': bool(section_of[i] >= 0)}
+            if item['found']:
+                tx, ty = tan[i].tolist()
+                item.update(layer=self.layers[section_of[i]], x=float(pts[i, 0]), y=float(pts[i, 1]),
+                            tangent=[tx, ty], bearing=math.degrees(math.atan2(tx, ty)) % 360.0)
+            out.append(item)
+        return out
+
+    def inverse(self, points):
+        """一批坐标 → [{x, y, mileage, layer, lateral, tangent}, ...]，取距离最近的分段。"""
+        q = as_points(points)
+        n = len(q)
+        best = np.full(n, np.inf)
+        owner = np.full(n, -1)
+        mileage = np.full(n, np.nan)
+        lateral = np.full(n, np.nan)
+        tangent = np.full((n, 2), np.nan)
+        if self.sections and n:
+            # 点到各分段包围盒的距离是到该分段距离的下界：由近到远处理分段，下界已超过当前最优的点跳过
+            gap = np.maximum(np.maximum(self.lo[:, None, :] - q, q - self.hi[:, None, :]), 0.0)
+            bound = np.hypot(gap[..., 0], gap[..., 1])           # (分段, 点)
+            for k in np.argsort(bound.min(axis=1), kind='stable'):
+                rows = np.flatnonzero(bound[k] <= best)
+                if not len(rows):
+                    continue
+                m, lat, tan = self.sections[k].project(q[rows])
+                better = np.abs(lat) < best[rows]
+                r = rows[better]
+                best[r], owner[r] = np.abs(lat[better]), k
+                mileage[r], lateral[r], tangent[r] = m[better], lat[better], tan[better]
+        out = []
+        for i in range(n):
+            item = {'x': float(q[i, 0]), 'y': float(q[i, 1]), 'found': bool(owner[i] >= 0)}
+            if item['found']:
+                item.update(mileage=float(mileage[i]), text=format_mileage(mileage[i]),
+                            layer=self.layers[owner[i]], lateral=float(lateral[i]),
+                            tangent=tangent[i].tolist())
+            out.append(item)
+        return out
+
+    def crossings(self, start=None, end=None):
+        """电力线交叉点，首次请求时计算并缓存；可按里程范围筛选。"""
+        with self._crossings_lock:
+            if self._crossings is None:
+                self._crossings = rail_power.find_crossings(self.dxf_path, self.rail_layers) or []
+        lo = -math.inf if start is None else parse_mileage(start)
+        hi = math.inf if end is None else parse_mileage(end)
+        return [dict(row, text=format_mileage(row['Mileage_m'])) for row in self._crossings
+                if row['Mileage_m'] is not None and lo <= row['Mileage_m'] <= hi]
+
+
+class Service:
+    """持有当前 Corridor，DXF 修改时间变化时重新载入。"""
+
+    def __init__(self, dxf_path, rail_layers):
+        self.dxf_path = Path(dxf_path)
+        self.rail_layers = rail_layers
+        self.lock = threading.Lock()
+        self.corridor = Corridor(self.dxf_path, rail_layers)
+        print(f"[载入] {self.dxf_path}：{len(self.corridor.sections)} 个分段，"
+              f"{self.corridor.load_seconds:.2f}s")
+
+    def current(self):
+        try:
+            mtime = os.stat(self.dxf_path).st_mtime_ns
+        except OSError:
+            return self.corridor                    # 文件暂时不可读（如正在保存）时继续用旧数据
+        if mtime != self.corridor.mtime:
+            with self.lock:
+                if mtime != self.corridor.mtime:
+                    self.corridor = Corridor(self.dxf_path, self.rail_layers)
+                    print(f"[重新载入] {self.dxf_path}：{len(self.corridor.sections)} 个分段，"
+                          f"{self.corridor.load_seconds:.2f}s")
+        return self.corridor
+
+    def handle(self, method, path, query, body):
+        """分派请求，返回 (状态码, 可 JSON 序列化的对象)。"""
+        corridor = self.current()
+        if path == '/info':
+            return 200, corridor.info()
+        if path == '/forward':
+            values = body.get('mileages', []) if method == 'POST' else query.get('m', [])
+            return 200, corridor.forward(values)
+        if path == '/inverse':
+            if method == 'POST':
+                points = body.get('points', [])
+            else:
+                xs, ys = query.get('x', []), query.get('y', [])
+                if len(xs) != len(ys):
+                    raise ValueError(f'x 与 y 的个数不一致：{len(xs)} 个 x，{len(ys)} 个 y')
+                points = list(zip(map(float, xs), map(float, ys)))
+            return 200, corridor.inverse(points)
+        if path == '/crossings':
+            source = body if method == 'POST' else {k: v[0] for k, v in query.items()}
+            return 200, corridor.crossings(source.get('from'), source.get('to'))
+        if path == '/batch' and method == 'POST':
+            return 200, {'forward': corridor.forward(body.get('forward', [])),
+                         'inverse': corridor.inverse(body.get('inverse', []))}
+        return 404, {'error': f'未知接口：{method} {path}'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    service = None                                   # 由 serve() 设置
+
+    def _reply(self, method):
+        url = urlparse(self.path)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}') if method == 'POST' else {}
+            status, result = self.service.handle(method, url.path.rstrip('/') or '/',
+                                                 parse_qs(url.query), body)
+        except (ValueError, KeyError, TypeError) as e:
+            status, result = 400, {'error': str(e)}
+        except Exception as e:                       # 如重新载入图纸失败，仍以 JSON 返回错误
+            status, result = 500, {'error': f'{type(e).__name__}: {e}'}
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._reply('GET')
+
+    def do_POST(self):
+        self._reply('POST')
+
+    def address_string(self):
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(service, host=HOST, port=PORT, socket_path=None):
+    """建立 HTTP 服务器（给出 socket_path 时监听 Unix 套接字），尚未开始服务。"""
+    handler = type('RailHandler', (Handler,), {'service': service})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='常驻内存的里程正反算 / 交叉点查询服务')
+    parser.add_argument('dxf', help='DXF 文件路径')
+    parser.add_argument('--config', help='JSON 配置文件，取其中的 rail_layers（缺省为 rail_power.RAIL_LAYERS）')
+    parser.add_argument('--host', default=HOST, help='监听地址（缺省只监听本机）')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--socket', help='改为监听此 Unix 套接字路径')
+    args = parser.parse_args(argv)
+
+    rail_layers = rail_power.RAIL_LAYERS
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            rail_layers = json.load(f).get('rail_layers', rail_layers)
+
+    server = make_server(Service(args.dxf, rail_layers), args.host, args.port, args.socket)
+    where = args.socket or f'http://{args.host}:{args.port}'
+    print(f"[OK] 服务已启动 → {where}（Ctrl+C 结束）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_splice.py — 只写新增实体的快速 DXF 输出
+# 1) 'splice'：按字节复制原文件，只在 LAYER 表末尾插入新图层、在 ENTITIES 段末尾插入新实体，
+#    并更新 $HANDSEED；原图其余内容原样保留，耗时随新增实体数而非图纸大小增长
+# 2) 'overlay'：新图层和新实体单独写成一个小 DXF，可作为外部参照叠加到原图
+# 3) 'full'：读入整张图后 doc.saveas 重写（原做法）
+# 4) 新实体先在临时 ezdxf 文档中构造，再按原图版本导出文本，句柄从原图 $HANDSEED 起顺延
+# 5) 二进制 DXF 同样按标签位置拼接，新实体以二进制标签写出，输出仍为二进制；
+#    R12 或结构无法识别时自动退回 'full'
+# 6) overlay / full 可选二进制输出（binary=True），供后续步骤快速读取
+
+import io
+import re
+import struct
+
+import ezdxf
+from ezdxf.lldxf.const import DXFStructureError
+from ezdxf.lldxf.tagwriter import BinaryTagWriter, TagWriter
+from ezdxf.tools.codepage import toencoding
+
+from rail_binary import SIGNATURE, binary_version, scan_tags, tag_value
+
+SAVE_MODES = ('splice', 'overlay', 'full')
+
+_ENDSEC = re.compile(rb'\n[ \t]*0[ \t]*\r?\nENDSEC[ \t]*\r?\n')
+
+
+class SpliceError(Exception):
+    """原文件无法按追加方式写出。"""
+
+
+def _pairs(data, pos=0):
+    """从 pos 开始逐对读取 (组码, 值, 组码行起点, 值起点, 值终点)，值不含行尾。"""
+    n = len(data)
+    while pos < n:
+        e1 = data.find(b'\n', pos)
+        if e1 < 0:
+            return
+        e2 = data.find(b'\n', e1 + 1)
+        if e2 < 0:
+            e2 = n
+        end = e2 - 1 if e2 > e1 + 1 and data[e2 - 1:e2] == b'\r' else e2
+        yield data[pos:e1].strip(), data[e1 + 1:end], pos, e1 + 1, end
+        pos = e2 + 1
+
+
+def _skip(data, pos):
+    """从 pos 起找到 ENDSEC，返回 (ENDSEC 组码行起点, 其后位置)，找不到时为 None。"""
+    match = _ENDSEC.search(data, pos)
+    return None if match is None else (match.start() + 1, match.end())
+
+
+def _binary_pairs(data, pos=len(SIGNATURE)):
+    """二进制 DXF 版本的 _pairs：组码转为 ASCII 字节，数值转为文本，位置含义相同。"""
+    for code, start, stop, _ in scan_tags(data, pos):
+        value = tag_value(data, code, start, stop, 'latin-1')     # latin-1 原样保留字符串字节
+        value = value.encode('latin-1') if isinstance(value, str) else str(value).encode('ascii')
+        yield str(code).encode('ascii'), value, start - 2, start, stop
+
+
+def _binary_skip(data, pos):
+    """二进制 DXF 版本的 _skip，pos 为段名字符串的值终点（其后是结尾的 0）。"""
+    for code, start, stop, nxt in scan_tags(data, pos + 1):
+        if code == 0 and data[start:stop] == b'ENDSEC':
+            return start - 2, nxt
+    return None
+
+
+def _scan(data, binary=False):
+    """
+    扫描 HEADER 与 TABLES 段，定位拼接所需的位置和句柄；其余段只做字节查找找到段尾。
+    返回字典：version、handseed (值, 起, 止)、codepage、layer_table、layer_count (值, 起, 止)、
+    layer_endtab、layer_names、layer_refs、model_space、entities_end。
+    """
+    info = {'layer_names': set(), 'layer_refs': {}}
+    section = table = var = None
+    entry = None                              # 当前表项：[类型, {组码: 值}]
+    read, skip = (_binary_pairs, _binary_skip) if binary else (_pairs, _skip)
+    pairs = read(data)
+    while True:
+        try:
+            code, value, start, vstart, vend = next(pairs)
+        except StopIteration:
+            break
+        if code == b'0':
+            value = value.strip()
+            if entry is not None:
+                _close_entry(info, entry)
+                entry = None
+            if value == b'SECTION':
+                section = None
+            elif value == b'ENDSEC':
+                section = table = None
+            elif value == b'TABLE':
+                table = 'head'
+            elif value == b'ENDTAB':
+                if table == 'LAYER':
+                    info['layer_endtab'] = start
+                table = None
+            elif value == b'EOF':
+                break
+            elif section == 'TABLES' and table not in (None, 'head'):
+                entry = [value.decode('ascii', 'replace'), {}]
+            continue
+        if section is None and code == b'2':
+            section = value.strip().decode('ascii', 'replace')
+            if section in ('CLASSES', 'BLOCKS', 'ENTITIES'):
+                found = skip(data, vend)
+                if found is None:
+                    raise SpliceError(f'{section} 段没有结尾')
+                if section == 'ENTITIES':
+                    info['entities_end'] = found[0]
+                    break
+                pairs = read(data, found[1])          # 不需要的段整段跳过
+                section = None
+            continue
+        if section == 'HEADER':
+            if code == b'9':
+                var = value.strip()
+            elif var == b'$ACADVER':
+                info['version'] = value.strip().decode('ascii')
+            elif var == b'$HANDSEED':
+                info['handseed'] = (value.strip().decode('ascii'), vstart, vend)
+            elif var == b'$DWGCODEPAGE':
+                info['codepage'] = value.strip().decode('ascii')
+        elif section == 'TABLES':
+            if table == 'head':
+                if code == b'2':
+                    table = value.strip().decode('ascii', 'replace')
+                continue
+            if entry is not None:
+                entry[1].setdefault(code, value)
+            elif table == 'LAYER' and code == b'5':
+                info['layer_table'] = value.strip().decode('ascii')
+            elif table == 'LAYER' and code == b'70':
+                info['layer_count'] = (int(value), vstart, vend)
+    return info
+
+
+def _close_entry(info, entry):
+    kind, tags = entry
+    name = tags.get(b'2', b'').strip()
+    if kind == 'LAYER':
+        info['layer_names'].add(name.upper())
+        if name == b'0':
+            info['layer_refs'] = {k: tags[k].strip().decode('ascii')
+                                  for k in (b'390', b'347') if k in tags}
+    elif kind == 'BLOCK_RECORD' and name.upper() == b'*MODEL_SPACE':
+        info['model_space'] = tags.get(b'5', b'').strip().decode('ascii')
+
+
+def _export(version, encoding, layers, build, info, binary=False):
+    """
+    在临时文档中构造原图没有的图层和新实体，分配句柄后导出为 DXF 文本（binary 时为二进制标签字节），
+    返回 (图层文本, 实体文本, 新图层数, 新实体数, 新句柄种子)。
+    """
+    doc = ezdxf.new(version)
+    msp = doc.modelspace()
+    new_layers = [doc.layers.add(name, color=color) for name, color in layers.items()
+                  if name.encode(encoding, errors='dxfreplace').upper() not in info['layer_names']]
+    build(msp)
+
+    seed = int(info['handseed'][0], 16)
+
+    def take():
+        nonlocal seed
+        handle = f'{seed:X}'
+        seed += 1
+        return handle
+
+    refs = info['layer_refs']
+    for layer in new_layers:
+        layer.dxf.handle = take()
+        layer.dxf.owner = info['layer_table']
+        for code, attr in ((b'390', 'plotstyle_handle'), (b'347', 'material_handle')):
+            if code in refs:
+                layer.dxf.set(attr, refs[code])
+            else:
+                layer.dxf.discard(attr)
+    entities = list(msp)
+    for e in entities:
+        e.dxf.handle = take()
+        e.dxf.owner = info['model_space']
+        if e.dxftype() == 'POLYLINE':
+            for sub in list(e.vertices) + [e.seqend]:
+                sub.dxf.handle = take()
+                sub.dxf.owner = e.dxf.handle
+
+    def text(items):
+        if binary:
+            stream = io.BytesIO()
+            writer = BinaryTagWriter(stream, version, encoding=encoding)
+        else:
+            stream = io.StringIO()
+            writer = TagWriter(stream, dxfversion=version)
+        for item in items:
+            item.export_dxf(writer)
+        return stream.getvalue()
+
+    return text(new_layers), text(entities), len(new_layers), len(entities), f'{seed:X}'
+
+
+def splice(src_path, out_path, layers, build):
+    """
+    把 build(msp) 添加的实体及 layers（{图层名: 颜色}）中原图没有的图层追加到原文件的字节副本，
+    写入 out_path，格式（ASCII / 二进制）与原文件相同。原文件不适合拼接时抛出 SpliceError。返回新增实体数。
+    """
+    with open(src_path, 'rb') as f:
+        data = f.read()
+    binary = data.startswith(SIGNATURE)
+    if binary and binary_version(data)[0] <= 'AC1009':
+        raise SpliceError('R12 二进制 DXF')
+    try:
+        info = _scan(data, binary)
+    except DXFStructureError as e:
+        raise SpliceError(str(e))
+    version = info.get('version', 'AC1009')
+    if version <= 'AC1009':
+        raise SpliceError(f'DXF 版本 {version} 不支持 LWPOLYLINE')
+    for key in ('handseed', 'layer_table', 'layer_endtab', 'model_space', 'entities_end'):
+        if key not in info:
+            raise SpliceError(f'未找到 {key}')
+
+    encoding = 'utf-8' if version >= 'AC1021' else toencoding(info.get('codepage', 'ANSI_1252'))
+    layer_text, entity_text, n_layers, n_entities, seed = _export(version, encoding, layers, build,
+                                                                  info, binary)
+    newline = '\r\n' if b'\r\n' in data[:1024] else '\n'
+
+    def encode(text):
+        if binary:
+            return text
+        return text.replace('\n', newline).encode(encoding, errors='dxfreplace')
+
+    # 按位置从前到后替换 / 插入：$HANDSEED、LAYER 表项数、LAYER 表末尾、ENTITIES 段末尾
+    _, h0, h1 = info['handseed']
+    edits = [(h0, h1, seed.encode('ascii'))]
+    if 'layer_count' in info and n_layers:
+        count, c0, c1 = info['layer_count']
+        edits.append((c0, c1, struct.pack('<h', count + n_layers) if binary
+                      else str(count + n_layers).encode('ascii')))
+    edits.append((info['layer_endtab'], info['layer_endtab'], encode(layer_text)))
+    edits.append((info['entities_end'], info['entities_end'], encode(entity_text)))
+
+    with open(out_path, 'wb') as f:
+        pos = 0
+        for start, end, new in sorted(edits, key=lambda e: e[0]):
+            f.write(data[pos:start])
+            f.write(new)
+            pos = end
+        f.write(data[pos:])
+    return n_entities
+
+
+def overlay(out_path, layers, build, binary=False):
+    """只把新图层和 build(msp) 添加的实体写成一个独立的小 DXF（binary 时为二进制 DXF）。"""
+    doc = ezdxf.new()
+    for name, color in layers.items():
+        if name not in doc.layers:
+            doc.layers.add(name, color=color)
+    build(doc.modelspace())
+    doc.saveas(out_path, fmt='bin' if binary else 'asc')
+
+
+def save_additions(src_path, out_path, layers, build, mode='splice', doc=None, binary=False):
+    """
+    按 mode 写出新增内容，返回实际采用的方式：
+    - 'splice'：拼接到原文件副本（格式同原文件），无法拼接时提示并退回 'full'
+    - 'overlay'：只写新增内容的小 DXF
+    - 'full'：在 doc（缺省时读入 src_path）中添加图层和实体后整图保存
+    binary 为真时 overlay / full 输出二进制 DXF；要让 splice 输出二进制，src_path 应为二进制
+    （见 rail_binary.sidecar）。
+    """
+    if mode == 'overlay':
+        overlay(out_path, layers, build, binary)
+        return mode
+    if mode == 'splice':
+        try:
+            splice(src_path, out_path, layers, build)
+            return mode
+        except SpliceError as e:
+            print(f"[提示] 无法追加写入（{e}），改为整图保存。")
+    if doc is None:
+        doc = ezdxf.readfile(src_path)
+    existing = {layer.dxf.name for layer in doc.layers}
+    for name, color in layers.items():
+        if name not in existing:
+            doc.layers.new(name=name, dxfattribs={'color': color})
+    build(doc.modelspace())
+    doc.saveas(out_path, fmt='bin' if binary else 'asc')
+    return 'full'
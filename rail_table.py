@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# rail_table.py — 交叉表 / 里程-角度表的读写，按扩展名选择格式
+# 1) .csv：标准库 csv 模块，UTF-8 带 BOM（Excel 可直接打开中文），不依赖 pandas
+# 2) .xlsx：openpyxl 只写 / 只读模式逐行流式处理，内存不随行数增长
+# 3) .parquet / .feather / .arrow：pyarrow 列式格式；.xls：pandas + xlrd
+# 4) 第三方库只在用到对应格式时才导入，CSV 路径启动和读写均为毫秒级
+
+import csv
+from pathlib import Path
+
+FORMATS = {
+    '.csv': 'csv',
+    '.xlsx': 'xlsx',
+    '.xls': 'xls',
+    '.parquet': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather',
+}
+WRITE_FORMATS = ('xlsx', 'csv', 'parquet', 'feather')
+
+
+def table_format(path):
+    """由扩展名判断表格格式，不支持时抛出 ValueError。"""
+    fmt = FORMATS.get(Path(path).suffix.lower())
+    if fmt is None:
+        raise ValueError(f"不支持的表格格式：{Path(path).suffix}（可用 {', '.join(FORMATS)}）")
+    return fmt
+
+
+def _require(module, fmt):
+    """按需导入第三方库，缺失时给出安装提示。"""
+    import importlib
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f"{fmt} 格式需要安装 {module.split('.')[0]}") from None
+
+
+def write_table(rows, path, columns):
+    """
+    把行 rows（字典，键为列名；可以是生成器，CSV / xlsx 边生成边写）按 columns 的列顺序
+    写入 path，格式由扩展名决定。
+    """
+    path = Path(path)
+    fmt = table_format(path)
+    if fmt == 'csv':
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows([_cell(row.get(c)) for c in columns] for row in rows)
+    elif fmt == 'xlsx':
+        openpyxl = _require('openpyxl', fmt)
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet('Sheet1')
+        ws.append(list(columns))
+        for row in rows:
+            ws.append([row.get(c) for c in columns])
+        wb.save(path)
+    elif fmt in ('parquet', 'feather'):
+        pa = _require('pyarrow', fmt)
+        rows = list(rows)                     # 列式格式按列取值，需要整表
+        table = pa.table({c: [row.get(c) for row in rows] for c in columns})
+        if fmt == 'parquet':
+            _require('pyarrow.parquet', fmt).write_table(table, path)
+        else:
+            _require('pyarrow.feather', fmt).write_feather(table, path)
+    else:
+        raise ValueError(f"{fmt} 格式只支持读取")
+
+
+def _cell(value):
+    return '' if value is None else value
+
+
+def _number(text):
+    """
+    CSV 中的文本尽量转为数值，空串视为 None。整数形式的文本保持为 int，
+    如角度 6815（68°15′）不会变成 6815.0，与 pandas.read_csv 的整数列相同。
+    """
+    if text == '':
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def read_table(path):
+    """
+    读取表格，返回 (列名列表, 行列表)，每行为按列顺序的元组。
+    CSV 中能转为数值的单元格转为 int 或 float，其余保持文本。
+    """
+    path = Path(path)
+    fmt = table_format(path)
+    if fmt == 'csv':
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            rows = [tuple(_number(v) for v in line) for line in reader if line]
+        return header, rows
+    if fmt == 'xlsx':
+        openpyxl = _require('openpyxl', fmt)
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            lines = wb.worksheets[0].iter_rows(values_only=True)
+            header = [str(v) for v in next(lines, ())]
+            rows = [tuple(line) for line in lines if any(v is not None for v in line)]
+        finally:
+            wb.close()
+        return header, rows
+    if fmt in ('parquet', 'feather'):
+        _require('pyarrow', fmt)
+        if fmt == 'parquet':
+            table = _require('pyarrow.parquet', fmt).read_table(path)
+        else:
+            table = _require('pyarrow.feather', fmt).read_table(path)
+        return table.column_names, list(zip(*(col.to_pylist() for col in table.columns)))
+    pd = _require('pandas', fmt)
+    df = pd.read_excel(path, header=0)
+    return [str(c) for c in df.columns], list(df.itertuples(index=False, name=None))